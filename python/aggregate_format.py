@@ -0,0 +1,103 @@
+# Typed, columnar form of the MapReduce aggregate (part-r-00000).
+# The job writes lines like "YYYY-MM-sentiment-rating-asin\tcount"; this module
+# converts them once into Parquet with one typed column per key part, so the
+# dashboard and the Spark report read the columns directly instead of splitting
+# key strings.
+#
+#   python aggregate_format.py data/part-r-00000 [--output data/part-r-00000.parquet]
+import argparse
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+AGGREGATE_SCHEMA = pa.schema([
+    ("year", pa.int16()),
+    ("month", pa.int8()),
+    ("sentiment", pa.string()),
+    ("rating", pa.int8()),
+    ("asin", pa.string()),
+    ("count", pa.int64()),
+])
+
+# Repetitive string columns, read back dictionary-encoded (pandas categoricals)
+DICTIONARY_COLUMNS = ["sentiment", "asin"]
+
+# Text lines converted per Parquet row group
+CONVERT_CHUNK_ROWS = 1 << 20
+
+# Where the typed copy of a part file lives by default
+def typed_path(part_path):
+    return part_path + ".parquet"
+
+# Split one chunk of "keys\tcount" rows into typed columns. Year and month are the
+# first two parts and rating and asin the last two, so a sentiment label that
+# contains a dash still ends up whole.
+def parse_part_chunk(raw):
+    head = raw["keys"].str.split("-", n=2, expand=True)
+    tail = head[2].str.rsplit("-", n=2, expand=True)
+    return pa.table({
+        "year": head[0].astype("int16").to_numpy(),
+        "month": head[1].astype("int8").to_numpy(),
+        "sentiment": tail[0].to_numpy(),
+        "rating": pd.to_numeric(tail[1]).astype("int8").to_numpy(),
+        "asin": tail[2].to_numpy(),
+        "count": raw["count"].to_numpy(),
+    }, schema=AGGREGATE_SCHEMA)
+
+# Convert the text output chunk by chunk (never the whole file in memory)
+def convert_part_file(part_path, output_path=None):
+    output_path = output_path or typed_path(part_path)
+    tmp_path = output_path + ".tmp"
+
+    reader = pd.read_csv(
+        part_path,
+        sep="\t",
+        header=None,
+        names=["keys", "count"],
+        dtype={"keys": str, "count": "int64"},
+        quoting=csv.QUOTE_NONE,
+        na_filter=False,
+        chunksize=CONVERT_CHUNK_ROWS
+    )
+    with pq.ParquetWriter(tmp_path, AGGREGATE_SCHEMA) as writer:
+        for raw in reader:
+            writer.write_table(parse_part_chunk(raw))
+    os.replace(tmp_path, output_path)
+    return output_path
+
+# Write an aggregate DataFrame that already has the typed columns
+def write_aggregates(df, path):
+    table = pa.Table.from_pandas(df[AGGREGATE_SCHEMA.names], schema=AGGREGATE_SCHEMA, preserve_index=False)
+    tmp_path = path + ".tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+def read_aggregates(path, columns=None):
+    table = pq.read_table(path, columns=columns, read_dictionary=DICTIONARY_COLUMNS, memory_map=True)
+    return table.to_pandas()
+
+# Path of an up-to-date typed copy of the part file, converting it first when the
+# copy is missing or older than the text output
+def ensure_typed_aggregates(part_path, output_path=None):
+    output_path = output_path or typed_path(part_path)
+    if not os.path.exists(output_path) or os.path.getmtime(output_path) < os.path.getmtime(part_path):
+        print(f"Converting {part_path} to {output_path}")
+        convert_part_file(part_path, output_path)
+    return output_path
+
+# Ordered rating categories from the int8 ratings; anything outside 1-5 is missing
+def rating_categorical(ratings, dtype):
+    codes = np.asarray(ratings, dtype=np.int64) - 1
+    codes[(codes < 0) | (codes >= len(dtype.categories))] = -1
+    return pd.Categorical.from_codes(codes, dtype=dtype)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert the MapReduce aggregate to typed Parquet")
+    parser.add_argument("part_file", help="Text output of the MapReduce job (part-r-00000)")
+    parser.add_argument("--output", default=None, help="Parquet file to write (default: <part_file>.parquet)")
+    cli_args = parser.parse_args()
+    print(f"Wrote {convert_part_file(cli_args.part_file, cli_args.output)}")
@@ -0,0 +1,158 @@
+# Synthetic input files in the real schema, for benchmarking the dashboard at any size:
+#   <root>/data/part-r-00000                       MapReduce aggregate ("YYYY-MM-sentiment-rating-asin\tcount")
+#   <root>/data/meta_Video_Games.jsonl             product metadata
+#   <root>/data/Video_Games_with_sentiment.jsonl   reviews with sentiment labels
+#
+#   python benchmarks/generate_data.py --reviews 1000000 --root benchmarks/data/1m
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime
+
+import numpy as np
+
+PART_FILE = "data/part-r-00000"
+METADATA_FILE = "data/meta_Video_Games.jsonl"
+REVIEWS_FILE = "data/Video_Games_with_sentiment.jsonl"
+
+# Reviews generated per numpy step
+CHUNK_REVIEWS = 100_000
+
+# Words every vocabulary starts with, so brand mentions and stopwords occur naturally
+BASE_WORDS = [
+    "the", "and", "this", "game", "is", "a", "it", "to", "for", "great", "fun", "not",
+    "works", "love", "bad", "broken", "graphics", "story", "play", "price", "worth",
+    "xbox", "microsoft", "nintendo", "switch", "sony", "playstation", "controller", "halo",
+]
+LETTERS = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+
+SENTIMENTS = ["positive", "neutral", "negative"]
+RATINGS = [1, 2, 3, 4, 5]
+RATING_WEIGHTS = [0.10, 0.06, 0.09, 0.17, 0.58]
+
+FIRST_YEAR = 2000
+LAST_YEAR = 2023
+
+def make_vocabulary(size, rng):
+    words = list(BASE_WORDS)
+    seen = set(words)
+    while len(words) < size:
+        word = "".join(rng.choice(LETTERS, rng.integers(3, 10)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return np.array(words, dtype=object)
+
+# Zipf-like word probabilities, like natural text
+def word_probabilities(size):
+    weights = 1.0 / np.arange(1, size + 1)
+    return weights / weights.sum()
+
+def random_texts(rng, vocab, probabilities, lengths):
+    words = vocab[rng.choice(len(vocab), size=int(lengths.sum()), p=probabilities)]
+    bounds = np.concatenate(([0], np.cumsum(lengths)))
+    return [" ".join(words[start:stop]) for start, stop in zip(bounds, bounds[1:])]
+
+def write_metadata(path, asins, titles, rng):
+    with open(path, "w") as f:
+        for asin, title in zip(asins, titles):
+            f.write(json.dumps({
+                "main_category": "Video Games",
+                "title": title,
+                "average_rating": round(float(rng.uniform(1, 5)), 1),
+                "rating_number": int(rng.integers(1, 5000)),
+                "features": [title],
+                "description": [],
+                "price": round(float(rng.uniform(5, 70)), 2),
+                "images": [],
+                "videos": [],
+                "store": "Synthetic",
+                "categories": ["Video Games"],
+                "details": {"Release date": "January 1, 2020"},
+                "parent_asin": asin,
+                "bought_together": None
+            }) + "\n")
+
+# Write the reviews and return the (year, month, sentiment, rating, asin) counts of the aggregate
+def write_reviews(path, reviews, asins, rng, vocab, probabilities):
+    # Popular products get most reviews
+    product_probabilities = word_probabilities(len(asins))
+    first = datetime(FIRST_YEAR, 1, 1).timestamp()
+    last = datetime(LAST_YEAR, 12, 31).timestamp()
+    counts = Counter()
+
+    with open(path, "w") as f:
+        for chunk_start in range(0, reviews, CHUNK_REVIEWS):
+            n = min(CHUNK_REVIEWS, reviews - chunk_start)
+            ratings = rng.choice(RATINGS, size=n, p=RATING_WEIGHTS)
+            # Sentiment follows the rating most of the time
+            sentiment_idx = np.where(ratings >= 4, 0, np.where(ratings == 3, 1, 2))
+            flip = rng.random(n) < 0.15
+            sentiment_idx[flip] = rng.integers(0, 3, flip.sum())
+            timestamps = (rng.uniform(first, last, n) * 1000).astype(np.int64)
+            products = rng.choice(len(asins), size=n, p=product_probabilities)
+            titles = random_texts(rng, vocab, probabilities, rng.integers(1, 8, n))
+            texts = random_texts(rng, vocab, probabilities, rng.integers(5, 80, n))
+
+            for i in range(n):
+                asin = asins[products[i]]
+                sentiment = SENTIMENTS[sentiment_idx[i]]
+                rating = int(ratings[i])
+                timestamp = int(timestamps[i])
+                f.write(json.dumps({
+                    "rating": float(rating),
+                    "title": titles[i],
+                    "text": texts[i],
+                    "images": [],
+                    "asin": asin,
+                    "parent_asin": asin,
+                    "user_id": f"U{chunk_start + i:012d}",
+                    "timestamp": timestamp,
+                    "helpful_vote": 0,
+                    "verified_purchase": True,
+                    "sentiment": sentiment
+                }) + "\n")
+                dt = datetime.fromtimestamp(timestamp / 1000)
+                counts[dt.year, dt.month, sentiment, rating, asin] += 1
+    return counts
+
+# Keys sorted like the MapReduce output
+def write_part_file(path, counts):
+    lines = sorted(
+        f"{year}-{month:02d}-{sentiment}-{rating}-{asin}\t{count}\n"
+        for (year, month, sentiment, rating, asin), count in counts.items()
+    )
+    with open(path, "w") as f:
+        f.writelines(lines)
+
+def generate(root, reviews, products=None, vocab_size=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.join(root, "data"), exist_ok=True)
+    products = products or max(10, reviews // 50)
+
+    vocab = make_vocabulary(vocab_size, rng)
+    probabilities = word_probabilities(len(vocab))
+    asins = [f"B{n:09d}" for n in range(products)]
+    titles = random_texts(rng, vocab, probabilities, rng.integers(2, 6, products))
+
+    write_metadata(os.path.join(root, METADATA_FILE), asins, titles, rng)
+    counts = write_reviews(os.path.join(root, REVIEWS_FILE), reviews, asins, rng, vocab, probabilities)
+    write_part_file(os.path.join(root, PART_FILE), counts)
+
+def is_generated(root):
+    return all(os.path.exists(os.path.join(root, name)) for name in (PART_FILE, METADATA_FILE, REVIEWS_FILE))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic dashboard input files")
+    parser.add_argument("--reviews", type=int, default=10_000, help="Number of reviews")
+    parser.add_argument("--products", type=int, default=None, help="Number of products (default: reviews / 50)")
+    parser.add_argument("--vocab-size", type=int, default=5000, help="Distinct words in the generated text")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--root", required=True, help="Directory to write data/ into")
+    cli_args = parser.parse_args()
+
+    started = time.perf_counter()
+    generate(cli_args.root, cli_args.reviews, cli_args.products, cli_args.vocab_size, cli_args.seed)
+    print(f"Generated {cli_args.reviews} reviews in {cli_args.root} in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,250 @@
+# Benchmarks for the dashboard loaders and callbacks on synthetic data (see generate_data.py).
+# Every loader runs in a fresh process so its peak memory is its own; the callbacks are
+# called directly (no browser) on one loaded snapshot. Results are written as JSON.
+#
+#   python benchmarks/run_benchmarks.py --reviews 100000 [--repeat 5] [--output results.json] [dash_app options]
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from statistics import median
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+PYTHON_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, PYTHON_DIR)
+
+from generate_data import PART_FILE, METADATA_FILE, REVIEWS_FILE, generate, is_generated
+
+# Version name the benchmark snapshots are built under (names the token store directory)
+BENCHMARK_VERSION = "benchmark"
+
+# Process-wide peak resident memory so far (ru_maxrss is in KB on Linux)
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# Import dash_app against a data root without starting its data store
+def import_dash_app(root, dash_args):
+    os.chdir(root)
+    os.environ["DASHBOARD_ROLE"] = "benchmark"
+    sys.argv = ["dash_app.py", *dash_args]
+    import dash_app
+    return dash_app
+
+# Time `func` `repeat` times; with `trace`, one extra run records the peak of traced
+# (Python and numpy) allocations, kept apart because tracing slows the timed runs down
+def measure(name, func, repeat=1, trace=False):
+    rss_before = peak_rss_mb()
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - started)
+
+    result = {
+        "name": name,
+        "seconds": seconds,
+        "median_seconds": median(seconds),
+        "min_seconds": min(seconds),
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_growth_mb": peak_rss_mb() - rss_before
+    }
+    if trace:
+        tracemalloc.start()
+        func()
+        result["traced_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result
+
+def remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+# Loader benchmarks in run order; later ones reuse what earlier ones left on disk
+# (the typed aggregate, the aggregate cache, the token store)
+def convert_part_file(dash_app):
+    from aggregate_format import convert_part_file, typed_path
+    remove(typed_path(dash_app.partfilename))
+    return lambda: convert_part_file(dash_app.partfilename)
+
+def parse_aggregated_data(dash_app):
+    return dash_app.parse_aggregated_data
+
+def load_aggregated_data_cold(dash_app):
+    remove(dash_app.aggregate_cache_filename)
+    return dash_app.load_aggregated_data
+
+def load_aggregated_data_cached(dash_app):
+    return dash_app.load_aggregated_data
+
+def load_detailed_data(dash_app):
+    return lambda: dash_app.load_detailed_data(BENCHMARK_VERSION)
+
+def build_word_index(dash_app):
+    from text_store import TokenStore
+    from word_index import WordFrequencyIndex
+    store = TokenStore(os.path.join(dash_app.token_store_dir, BENCHMARK_VERSION))
+    return lambda: WordFrequencyIndex.from_token_store(store, dash_app.sample)
+
+def load_dashboard_data(dash_app):
+    return lambda: dash_app.load_dashboard_data(BENCHMARK_VERSION)
+
+LOADER_CASES = {
+    "convert_part_file": convert_part_file,
+    "parse_aggregated_data": parse_aggregated_data,
+    "load_aggregated_data (cold)": load_aggregated_data_cold,
+    "load_aggregated_data (cached)": load_aggregated_data_cached,
+    "load_detailed_data": load_detailed_data,
+    "WordFrequencyIndex.from_token_store": build_word_index,
+    "load_dashboard_data": load_dashboard_data,
+}
+
+def run_loader_case(name, root, dash_args):
+    dash_app = import_dash_app(root, dash_args)
+    return [measure(name, LOADER_CASES[name](dash_app))]
+
+# Every callback with the full year range and the last three years, on one snapshot
+def run_callback_cases(root, dash_args, repeat):
+    dash_app = import_dash_app(root, dash_args)
+    from figure_payload import payload_bytes
+    dash_app.store.reload(BENCHMARK_VERSION)
+    data = dash_app.store.current()
+
+    results = [measure(
+        "get_filtered_word_frequencies",
+        lambda: dash_app.get_filtered_word_frequencies(data.word_index, 1, 2, "review_text", dash_app.WORDCLOUD_MAX_WORDS),
+        repeat, trace=True
+    )]
+    frequencies = dash_app.get_filtered_word_frequencies(data.word_index, 1, 2, "review_text", dash_app.WORDCLOUD_MAX_WORDS)
+    results.append(measure(
+        "create_wordcloud",
+        lambda: dash_app.create_wordcloud(frequencies, dash_app.WORDCLOUD_MAX_WORDS, *dash_app.WORDCLOUD_SIZE),
+        repeat, trace=True
+    ))
+
+    # Word cloud callbacks are measured on a warm render cache, as visitors see them
+    data.wordcloud_warmup.join()
+
+    first, last = int(min(data.years)), int(max(data.years))
+    year_ranges = [[first, last], [max(first, last - 2), last]]
+    calls = [
+        (callback, (years_range,))
+        for callback in [
+            dash_app.update_rating_pie,
+            dash_app.update_sentiment_pie,
+            dash_app.update_yearly_trend,
+            dash_app.update_rating_trends,
+            dash_app.update_brand_mentions,
+            dash_app.update_controller_sentiment,
+        ]
+        for years_range in year_ranges
+    ]
+    calls += [(dash_app.update_top_products, (years_range, [1, 5])) for years_range in year_ranges]
+    calls += [
+        (callback, (rating_range,))
+        for callback in [dash_app.update_wordcloud, dash_app.update_title_wordcloud]
+        for rating_range in [[1, 5], [1, 2]]
+    ]
+
+    # With a query cache every run starts from an empty cache, and a second measurement
+    # shows the callback answered from the cache (the word clouds have their own cache)
+    # Every callback's result is also sized as the JSON Dash sends to the browser
+    query_cache = dash_app.query_cache
+    for callback, inputs in calls:
+        name = f"{callback.__name__}({', '.join(map(str, inputs))})"
+        if query_cache is None or not hasattr(callback, "__wrapped__"):
+            results.append(measure(name, lambda: callback(*inputs), repeat, trace=True))
+        else:
+            results.append(measure(name, lambda: (query_cache.clear(), callback(*inputs)), repeat, trace=True))
+        results[-1]["payload_bytes"] = payload_bytes(callback(*inputs))
+        if query_cache is not None and hasattr(callback, "__wrapped__"):
+            results.append(measure(f"{name} [cached]", lambda: callback(*inputs), repeat))
+    if query_cache is not None:
+        print(f"Query cache: {query_cache.stats()}")
+    return results
+
+# Run one case in a fresh interpreter
+def in_subprocess(func, *args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(func, *args).result()
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=PYTHON_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def file_sizes(root):
+    return {name: os.path.getsize(os.path.join(root, name)) for name in (PART_FILE, METADATA_FILE, REVIEWS_FILE)}
+
+def print_summary(results):
+    print(f"{'benchmark':<60} {'median s':>10} {'peak RSS MB':>12} {'traced MB':>10} {'payload KB':>11}")
+    for result in results:
+        traced = result.get("traced_peak_mb")
+        payload = result.get("payload_bytes")
+        print(f"{result['name']:<60} {result['median_seconds']:>10.4f} {result['peak_rss_mb']:>12.1f} "
+              f"{'' if traced is None else f'{traced:.1f}':>10} {'' if payload is None else f'{payload / 1024:.1f}':>11}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard loaders and callbacks on synthetic data")
+    parser.add_argument("--reviews", type=int, default=10_000, help="Number of synthetic reviews")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data")
+    parser.add_argument("--root", default=None,
+                        help="Directory for the synthetic data (default: benchmarks/data/<reviews>)")
+    parser.add_argument("--regenerate", action="store_true", help="Generate the data even if it exists")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per callback")
+    parser.add_argument("--output", default=None,
+                        help="JSON file to write (default: benchmarks/results/<reviews>-<time>.json)")
+    args, dash_args = parser.parse_known_args()
+
+    root = os.path.abspath(args.root or os.path.join(BENCHMARK_DIR, "data", str(args.reviews)))
+    generate_seconds = None
+    if args.regenerate or not is_generated(root):
+        started = time.perf_counter()
+        generate(root, args.reviews, seed=args.seed)
+        generate_seconds = time.perf_counter() - started
+
+    results = []
+    for name in LOADER_CASES:
+        print(f"Running {name}...")
+        results.extend(in_subprocess(run_loader_case, name, root, dash_args))
+    print("Running callbacks...")
+    results.extend(in_subprocess(run_callback_cases, root, dash_args, args.repeat))
+
+    report = {
+        "meta": {
+            "reviews": args.reviews,
+            "seed": args.seed,
+            "root": root,
+            "file_sizes": file_sizes(root),
+            "generate_seconds": generate_seconds,
+            "dash_app_args": dash_args,
+            "repeat": args.repeat,
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": datetime.now().isoformat(timespec="seconds")
+        },
+        "results": results
+    }
+    output = args.output or os.path.join(
+        BENCHMARK_DIR, "results", f"{args.reviews}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print_summary(results)
+    print(f"Results written to {output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+# Chart and word cloud rendering for spark_codes.py, run in a pool of worker processes.
+# Every function takes the PNG path and only the small collected results (lists and
+# dicts) and writes one figure, so the driver can hand figures off and go on with the next Spark job.
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+matplotlib.use("Agg")  # no display in the workers; set before pyplot is imported
+import matplotlib.pyplot as plt
+from wordcloud import WordCloud, STOPWORDS
+
+# Pool the figures are rendered in, one figure per task. The workers are forked and
+# started right away, so create it before the SparkSession: the forks then carry no
+# JVM gateway threads, and spawned workers would re-run the driver script instead.
+def start_render_pool(workers):
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"))
+    pool.submit(os.getpid).result()
+    return pool
+
+# Wait for every submitted figure; a failed render raises here
+def wait_for_renders(futures):
+    return [future.result() for future in as_completed(futures)]
+
+# Function to save figures to file
+def save_figure(filepath, dpi=300):
+    plt.savefig(filepath, dpi=dpi, bbox_inches='tight')
+    print(f"Figure saved to {filepath}")
+    plt.close()
+    return filepath
+
+# Word cloud from raw text or from word frequencies
+def render_wordcloud(path, words, title, max_words):
+    wordcloud = WordCloud(
+        width=1000,
+        height=600,
+        background_color="white",
+        max_words=max_words,
+        stopwords=set(STOPWORDS)
+    )
+    if isinstance(words, dict):
+        wordcloud.generate_from_frequencies(words)
+    else:
+        wordcloud.generate(words)
+
+    # Create figure for the word cloud
+    plt.figure(figsize=(12, 6))
+    plt.imshow(wordcloud, interpolation="bilinear")
+    plt.axis("off")
+    plt.title(title)
+    return save_figure(path)
+
+# Pie chart, with a legend when legend_title is given
+def render_pie(path, labels, counts, title, legend_title=None):
+    plt.figure(figsize=(8, 8))
+    wedges, texts, autotexts = plt.pie(counts, labels=labels, autopct="%1.1f%%", startangle=140)
+    plt.title(title)
+    plt.axis("equal")
+    if legend_title:
+        plt.legend(wedges, labels, title=legend_title, loc="lower right")
+    return save_figure(path)
+
+# Top and bottom products by review count, one horizontal bar chart each
+def render_product_bars(path, top_titles, top_totals, bottom_titles, bottom_totals):
+    fig, axes = plt.subplots(2, 1, figsize=(12, 12))
+
+    # Top 10 - Horizontal Bar Chart (reversed for highest at top)
+    axes[0].barh(top_titles[::-1], top_totals[::-1])
+    axes[0].set_title("Top 10 Products by Review Count")
+    axes[0].set_xlabel("Review Count")
+    axes[0].set_ylabel("Product Title")
+
+    # Bottom 10 - Horizontal Bar Chart
+    axes[1].barh(bottom_titles, bottom_totals, color="orange")
+    axes[1].set_title("Bottom 10 Products by Review Count")
+    axes[1].set_xlabel("Review Count")
+    axes[1].set_ylabel("Product Title")
+
+    plt.tight_layout()
+    return save_figure(path)
+
+def render_yearly_trend(path, years, totals):
+    plt.figure(figsize=(12, 6))
+    plt.plot(years, totals, marker='o', linestyle='-', linewidth=2)
+
+    plt.title("Change in Review Counts (as Sales Proxy) from 2010 to 2023")
+    plt.xlabel("Year")
+    plt.ylabel("Total Review Count")
+    plt.grid(True)
+    return save_figure(path)
+
+# One line per rating; `series` maps each rating to its yearly totals
+def render_rating_trends(path, years, series):
+    plt.figure(figsize=(12, 6))
+    for rating, totals in series.items():
+        plt.plot(years, totals, marker='o', label=rating)
+
+    plt.title("Rating Trends Over Time")
+    plt.xlabel("Year")
+    plt.ylabel("Review Count")
+    plt.legend(title="Rating")
+    plt.grid(True)
+    plt.tight_layout()
+    return save_figure(path)
+
+# One line per brand; `series` maps each label to (color, monthly counts)
+def render_brand_mentions(path, year_months, series):
+    plt.figure(figsize=(14, 7))
+    for label, (color, counts) in series.items():
+        plt.plot(year_months, counts, label=label, color=color)
+
+    plt.title("Brand Mentions by Month")
+    plt.xlabel("Month")
+    plt.ylabel("Number of Mentions")
+    plt.grid(True)
+    plt.legend()
+
+    # Make x-axis labels more readable
+    plt.xticks(
+        ticks=range(0, len(year_months), 6),  # Every 6 months
+        labels=year_months[::6],
+        rotation=45
+    )
+
+    plt.tight_layout()
+    return save_figure(path)
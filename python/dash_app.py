@@ -1,129 +1,245 @@
 # Work Done by: [Muhammad Firdauz Bin Kamarulzaman]
 import pandas as pd
+import argparse
 import json
-import re
+import os
 import html
-from dash import Dash, dcc, html, Input, Output, callback
+from dash import Dash, dcc, html, Input, Output, callback, no_update
+from dash.exceptions import PreventUpdate
 import plotly.express as px
 import plotly.graph_objects as go
-from wordcloud import WordCloud, STOPWORDS
+from wordcloud import WordCloud
 import numpy as np
 import base64
 from io import BytesIO
-from datetime import datetime
+from functools import partial, wraps
+from types import SimpleNamespace
+from aggregate_format import ensure_typed_aggregates, read_aggregates, rating_categorical
+from data_cache import CACHE_DIR, data_version, is_cache_fresh, load_frame, prune_versions, save_frame
+from data_store import DataStore
+from figure_payload import PayloadStats, downsample_frame, epoch_ms, lttb_indices, payload_bytes, shorten_labels
+from incremental import ReviewMark, concat_reviews
+from jsonl_loader import load_reviews, load_title_map
+from keywords import load_keyword_registry
+from query_cache import QUERY_CACHE_BACKENDS, make_query_cache
+from render_cache import RenderCache
+from rollups import MonthlyMentions, RollupCube
+from sampling import SampleConfig, add_sampling_arguments, report_top_words
+from shared_data import attach_snapshot, manifest_path, publish_snapshot
+from word_index import WordFrequencyIndex
 # 
 # Initialize the Dash app
-app = Dash(__name__, external_stylesheets=['https://codepen.io/chriddyp/pen/bWLwgP.css'])
+# (the first page served may be the loading page, so callback ids are not validated against it)
+app = Dash(
+    __name__,
+    external_stylesheets=['https://codepen.io/chriddyp/pen/bWLwgP.css'],
+    suppress_callback_exceptions=True
+)
+
+# Command line options (unknown arguments are left for the server)
+parser = argparse.ArgumentParser(description="Video Games Reviews Dashboard")
+parser.add_argument(
+    "--max-memory",
+    type=int,
+    default=None,
+    help="Memory cap in MB for parsing the review JSONL (smaller values use smaller batches)"
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=1,
+    help="Number of processes used to parse the JSONL files at startup"
+)
+parser.add_argument(
+    "--aggregates",
+    default=None,
+    help="Build the aggregate charts from the aggregates.parquet written by spark_codes.py instead of part-r-00000"
+)
+parser.add_argument(
+    "--persist-wordclouds",
+    action="store_true",
+    help="Also keep rendered word clouds on disk under data/cache so restarts reuse them"
+)
+parser.add_argument(
+    "--reload-interval",
+    type=int,
+    default=60,
+    help="Seconds between checks of the data files for changes (0 disables hot reload)"
+)
+parser.add_argument(
+    "--incremental",
+    action="store_true",
+    help="When lines were only appended to the review JSONL (see incremental.py), "
+         "reload by parsing just the new lines and merging them into the loaded data"
+)
+parser.add_argument(
+    "--query-cache",
+    choices=QUERY_CACHE_BACKENDS,
+    default="memory",
+    help="Memoize the chart queries per data version: memory (an LRU in each process), "
+         "sqlite (one file under data/cache shared by the serve.py workers) or off"
+)
+parser.add_argument(
+    "--query-cache-mb",
+    type=int,
+    default=64,
+    help="Size limit of the query cache in MB; the least recently used entries are evicted first"
+)
+parser.add_argument(
+    "--cache-figures",
+    action="store_true",
+    help="Also memoize the finished figures (as Plotly JSON), not only the query results"
+)
+parser.add_argument(
+    "--max-points",
+    type=int,
+    default=600,
+    help="Most points sent per time series; longer ones are downsampled with LTTB "
+         "(the charts are at most 1200 px wide)"
+)
+parser.add_argument(
+    "--title-chars",
+    type=int,
+    default=60,
+    help="Product titles in the top products chart are shortened to this many characters"
+)
+parser.add_argument(
+    "--payload-sample",
+    type=int,
+    default=10,
+    help="Measure the JSON size of 1 in N figures of each callback for /_payloads (0 to turn it off)"
+)
+# Word clouds can be built from a sample of the reviews (see sampling.py)
+add_sampling_arguments(parser)
+args, _ = parser.parse_known_args()
+sample = SampleConfig.from_args(args)
 
 # Define the file paths
 partfilename = "data/part-r-00000"
 metadata_filename = "data/meta_Video_Games.jsonl"
 data_filename = "data/Video_Games_with_sentiment.jsonl"
 
-# Load the aggregated data
-def load_aggregated_data():
-    data = []
-    with open(partfilename) as file:
-        lines = file.readlines()
-        for line in lines:
-            line = line.strip()
-            keys, count = line.split("\t")
-            year, month, sentiment, rating, asid = keys.split("-")
-            
-            # Add to list as a dictionary
-            data.append({
-                "year": int(year),
-                "month": month,
-                "sentiment": sentiment,
-                "rating": rating,
-                "asid": asid,
-                "count": int(count)
-            })
-    
-    # Create DataFrame from the list of dicts
-    df = pd.DataFrame(data)
-    
-    # Load product metadata JSONL
-    with open(metadata_filename, "r") as f:
-        metadata = [json.loads(line) for line in f]
-    
-    # Create mapping: parent_asin → title
-    title_map = {item["parent_asin"]: item["title"] for item in metadata}
+# Brand -> keyword lists used for the mention bitmask (see brand_keywords.json)
+registry = load_keyword_registry()
+
+# Columnar cache of the aggregated data (bump the schema when its columns change)
+aggregate_cache_filename = os.path.join(CACHE_DIR, "aggregate.feather")
+AGGREGATE_CACHE_SCHEMA = "aggregate-v1"
+
+# Token ids of the review titles and texts (see text_store.py)
+token_store_dir = os.path.join(CACHE_DIR, "tokens")
+
+# Memoized chart queries and figures (see query_cache.py), None when turned off
+query_cache = make_query_cache(args.query_cache, args.query_cache_mb, os.path.join(CACHE_DIR, "query_cache.sqlite"))
+
+# Options that change a finished figure. Cached figures are keyed on them too, so a
+# process started with other options never gets one of them from the shared SQLite file.
+figure_options = f"points{args.max_points}-title{args.title_chars}"
+
+# JSON bytes of the figures each callback returned (see figure_payload.py)
+payload_stats = PayloadStats(args.payload_sample)
+
+# Word cloud rendering settings (part of the render cache key)
+WORDCLOUD_MAX_WORDS = 100
+WORDCLOUD_SIZE = (800, 400)
+
+# Ratings are ordered so the string comparisons in the callbacks keep working
+rating_dtype = pd.CategoricalDtype([str(i) for i in range(1, 6)], ordered=True)
+
+# Read the MapReduce output from its typed Parquet copy (see aggregate_format.py,
+# converted here first if needed) and join it with product titles.
+# `known_titles` (asin -> title) saves looking those asins up in the metadata again.
+def parse_aggregated_data(known_titles=None):
+    aggregates = read_aggregates(ensure_typed_aggregates(partfilename))
+    
+    df = pd.DataFrame({
+        "year": aggregates["year"],
+        "month": aggregates["month"],
+        "sentiment": aggregates["sentiment"],
+        "rating": rating_categorical(aggregates["rating"], rating_dtype),
+        "asid": aggregates["asin"],
+        "count": aggregates["count"]
+    })
+    
+    # Create mapping: parent_asin → title from the product metadata JSONL,
+    # keeping only the products that appear in the aggregate
+    wanted = set(df["asid"].cat.categories)
+    title_map = {asin: title for asin, title in (known_titles or {}).items() if asin in wanted}
+    wanted.difference_update(title_map)
+    if wanted:
+        title_map.update(load_title_map(metadata_filename, workers=args.workers, wanted=wanted))
     
     # Map titles to review DataFrame based on 'asid'
-    df["title"] = df["asid"].map(title_map)
+    df["title"] = encode_titles(df["asid"], title_map)
     
     return df
 
-# Load the detailed review data for the wordclouds and brand mentions
-def load_detailed_data():
-    data = []
-    with open(data_filename, "r", encoding="utf-8") as file:
-        lines = file.readlines()
-    
-    for line in lines:
-        try:
-            review = json.loads(line)
-            
-            # Extract and process fields
-            rating = review.get("rating")
-            title_text = review.get("title", "").lower()
-            review_text = review.get("text", "").lower()
-            sentiment = review.get("sentiment")
-            asin = review.get("asin")
-            timestamp = review.get("timestamp")
-            
-            # Convert timestamp to year and month
-            if timestamp:
-                dt = datetime.fromtimestamp(timestamp / 1000)
-                year = dt.year
-                month = dt.month
-            else:
-                year = None
-                month = None
-            
-            # Combine title and text for keyword search
-            combined_text = title_text + " " + review_text
-            
-            # Detect mentions
-            mentions_xbox = any(kw in combined_text for kw in ["microsoft", "xbox"])
-            mentions_nintendo = any(kw in combined_text for kw in ["nintendo", "switch"])
-            mentions_sony = any(kw in combined_text for kw in ["sony", "playstation"])
-            mentions_controller = any(kw in combined_text for kw in ["controller"])
-            mentions_halo = any(kw in combined_text for kw in ["halo"])
-            
-            data.append({
-                "year": year,
-                "month": month,
-                "rating": rating,
-                "sentiment": sentiment,
-                "asin": asin,
-                "title_text": title_text,
-                "review_text": review_text,
-                "mentions_xbox": mentions_xbox,
-                "mentions_nintendo": mentions_nintendo,
-                "mentions_sony": mentions_sony,
-                "mentions_controller": mentions_controller,
-                "mentions_halo": mentions_halo,
-            })
-        except:
-            continue  # skip malformed lines
-    
-    # Convert to DataFrame
-    detailed_df = pd.DataFrame(data)
-    return detailed_df
-
-# Create wordclouds
-def create_wordcloud(text_data, max_words=100):
+# Look up each distinct asin's title once and dictionary-encode the titles,
+# so every row only stores an integer code instead of its own title string
+def encode_titles(asid, title_map):
+    asin_titles = pd.Categorical([title_map.get(asin) for asin in asid.cat.categories])
+    # The trailing -1 keeps rows without an asin untitled
+    title_codes = np.append(asin_titles.codes, -1)[asid.cat.codes.to_numpy()]
+    return pd.Categorical.from_codes(title_codes, categories=asin_titles.categories)
+
+# The title of every asin in an aggregate DataFrame (None for the untitled ones)
+def asin_titles(df):
+    asins, first_rows = np.unique(df["asid"].cat.codes.to_numpy(), return_index=True)
+    titles = df["title"].to_numpy()[first_rows[asins >= 0]]
+    return dict(zip(df["asid"].cat.categories[asins[asins >= 0]],
+                    [None if pd.isna(title) else title for title in titles]))
+
+# Load the aggregated data, reusing the columnar cache while the sources are unchanged
+# (the typed copy is the source: incremental.py merges new counts into it)
+def load_aggregated_data(known_titles=None):
+    sources = [ensure_typed_aggregates(partfilename), metadata_filename]
+    if is_cache_fresh(aggregate_cache_filename, sources, AGGREGATE_CACHE_SCHEMA):
+        return load_frame(aggregate_cache_filename)
+    
+    df = parse_aggregated_data(known_titles)
+    save_frame(df, aggregate_cache_filename, sources, AGGREGATE_CACHE_SCHEMA)
+    return df
+
+# Load the grouping sets saved by spark_codes.py. The year x rating x sentiment rows
+# have no title and the year x rating x title rows have no sentiment, which is
+# exactly what RollupCube needs from each.
+def load_aggregates_artifact(path):
+    aggregates = pd.read_parquet(path, columns=["year", "rating", "sentiment", "title", "total"])
+    return pd.DataFrame({
+        "year": aggregates["year"].astype("int16"),
+        "sentiment": aggregates["sentiment"].astype("category"),
+        "rating": aggregates["rating"].astype(str).astype(rating_dtype),
+        "title": aggregates["title"].astype("category"),
+        "count": aggregates["total"].astype("int64")
+    })
+
+# Load the detailed review data for the wordclouds and brand mentions.
+# The JSONL is streamed in batches straight into typed columns, so the raw
+# lines and per-review dicts never pile up in memory. With --workers the file
+# is split into line-aligned byte ranges and parsed in a process pool.
+# The titles and texts only go to an on-disk token store, one per data version.
+# Only the whole lines before `end` are read; with a `base` load (see load_datasets) only
+# those after it, appended after its token store's reviews.
+def load_detailed_data(version, end=None, base=None):
+    text_store_dir = os.path.join(token_store_dir, version)
+    # Returns the review DataFrame and the memory-mapped token store
+    detailed_df, text_store = load_reviews(data_filename, text_store_dir, max_memory_mb=args.max_memory,
+                                           workers=args.workers, registry=registry,
+                                           byte_range=(base.mark.size if base else 0, end),
+                                           base_store=base.text_store if base else None)
+    # Snapshots still being served keep the previous store mapped
+    prune_versions(token_store_dir, keep=version)
+    return detailed_df, text_store
+
+# Create wordclouds from precomputed word frequencies
+def create_wordcloud(frequencies, max_words=100, width=800, height=400):
     # Generate the word cloud
-    stopwords = set(STOPWORDS)
     wordcloud = WordCloud(
-        width=800,
-        height=400,
+        width=width,
+        height=height,
         background_color="white",
-        max_words=max_words,
-        stopwords=stopwords
-    ).generate(text_data)
+        max_words=max_words
+    ).generate_from_frequencies(frequencies)
     
     # Convert the image to a format that can be displayed in Dash
     img = wordcloud.to_image()
@@ -133,121 +249,319 @@ def create_wordcloud(text_data, max_words=100):
     
     return img_str
 
-# Function to get review text based on rating filter
-def get_filtered_review_text(df, min_rating=1, max_rating=5, text_field="review_text"):
-    filtered_df = df[(df["rating"] >= min_rating) & (df["rating"] <= max_rating)]
-    
-    texts = []
-    for _, row in filtered_df.iterrows():
-        text = row[text_field]
-        if isinstance(text, str):
-            clean_text = html.unescape(text)
-            clean_text = re.sub(r"<.*?>", " ", clean_text)
-            clean_text = re.sub(r"[^a-zA-Z0-9\s']", " ", clean_text).lower()
-            tokens = clean_text.split()
-            tokens = [word for word in tokens if len(word) > 1 or word in ("i", "a")]
-            texts.append(" ".join(tokens))
-    
-    all_text = " ".join(texts)
-    return all_text
+# Function to get word frequencies based on rating filter
+def get_filtered_word_frequencies(word_index, min_rating=1, max_rating=5, text_field="review_text", max_words=100):
+    return word_index.frequencies(text_field, min_rating, max_rating, max_words)
+
+# Render one word cloud; used by the render cache on a miss
+def render_wordcloud(word_index, text_field, rating_range, max_words, size):
+    frequencies = get_filtered_word_frequencies(word_index, rating_range[0], rating_range[1], text_field, max_words)
+    return create_wordcloud(frequencies, max_words, *size)
+
+# Every [min, max] pair the rating slider can produce, for both word clouds
+def all_wordcloud_keys():
+    return [
+        (text_field, (min_rating, max_rating), WORDCLOUD_MAX_WORDS, WORDCLOUD_SIZE)
+        for text_field in ["review_text", "title_text"]
+        for min_rating in range(1, 6)
+        for max_rating in range(min_rating, 6)
+    ]
+
+# What the last load read and built, kept with --incremental for the next reload
+last_load = None
+
+# Load the aggregated and detailed datasets from the source files (or their caches).
+# With --incremental, a reload after lines were only appended to the review JSONL parses
+# just those lines and merges them into the last load's reviews, token store, word counts
+# and monthly series; the aggregate keeps the titles it already looked up.
+def load_datasets(version):
+    global last_load
+    mark = ReviewMark(data_filename, metadata_filename) if args.incremental else None
+    base = last_load if mark and last_load and last_load.mark.is_extended_by(mark) else None
+    
+    if args.aggregates:
+        df = load_aggregates_artifact(args.aggregates)
+    else:
+        df = load_aggregated_data(asin_titles(base.df) if base else None)
+    detailed_df, text_store = load_detailed_data(version, mark.size if mark else None, base)
+    mentions = None
+    if base:
+        print(f"Merging {len(detailed_df)} appended reviews into the {len(base.detailed_df)} loaded ones")
+        if base.mentions is not None:
+            mentions = base.mentions.merged(MonthlyMentions(detailed_df, registry))
+        detailed_df = concat_reviews(base.detailed_df, detailed_df)
+    
+    if base and not sample.active:
+        word_index = base.word_index.extended(text_store, base.text_store)
+    else:
+        word_index = WordFrequencyIndex.from_token_store(text_store, sample)
+    if sample.active:
+        report_top_words("Review text", sample, word_index.top_words("review_text"))
+        report_top_words("Review title", sample, word_index.top_words("title_text"))
+    
+    if mark:
+        last_load = SimpleNamespace(mark=mark, df=df, detailed_df=detailed_df, word_index=word_index,
+                                    text_store=text_store, mentions=mentions)
+    return df, detailed_df, word_index, text_store
+
+# Monthly series of the review rows; an incremental load has merged them already
+def monthly_mentions(detailed_df):
+    if last_load is not None and last_load.detailed_df is detailed_df:
+        if last_load.mentions is None:
+            last_load.mentions = MonthlyMentions(detailed_df, registry)
+        return last_load.mentions
+    return MonthlyMentions(detailed_df, registry)
+
+# Build one snapshot from the datasets and everything precomputed from them.
+# serve.py workers pass the rollups and the `wordcloud_cache` of the shared export,
+# which the exporter built and fills.
+def build_snapshot(version, df, detailed_df, word_index, text_store, wordcloud_cache=None,
+                   cube=None, mentions=None):
+    wordcloud_warmup = None
+    if wordcloud_cache is None:
+        # Rendered word clouds are shared by every visitor and rebuilt only when the reviews
+        # or the sample they are counted from change
+        wordcloud_cache = RenderCache(
+            partial(render_wordcloud, word_index),
+            version=f"{data_version([data_filename])}-{sample.key()}",
+            disk_dir=os.path.join(CACHE_DIR, "wordclouds") if args.persist_wordclouds else None
+        )
+        wordcloud_warmup = wordcloud_cache.warm_in_background(all_wordcloud_keys())
+    
+    return SimpleNamespace(
+        version=version,
+        df=df,
+        detailed_df=detailed_df,
+        word_index=word_index,
+        text_store=text_store,
+        # Precompute the year rollups used by the aggregate callbacks
+        cube=cube if cube is not None else RollupCube(df),
+        # Monthly series for the brand and controller charts
+        mentions=mentions if mentions is not None else monthly_mentions(detailed_df),
+        wordcloud_cache=wordcloud_cache,
+        wordcloud_warmup=wordcloud_warmup,
+        # Get unique years for dropdown
+        years=sorted(df["year"].unique())
+    )
 
-# Load the data
-df = load_aggregated_data()
-detailed_df = load_detailed_data()
+# Load the data and everything precomputed from it into one snapshot.
+# Runs on the data store's background thread, at startup and whenever the files change.
+def load_dashboard_data(version):
+    return build_snapshot(version, *load_datasets(version))
 
-# Create date columns for detailed data
-detailed_df["date"] = pd.to_datetime(detailed_df[["year", "month"]].assign(day=1))
-detailed_df["year_month"] = detailed_df["date"].dt.to_period("M")
+# Word clouds of one shared export, stored in the export's directory (and pruned with it)
+def shared_wordcloud_cache(shared_dir, version, word_index):
+    return RenderCache(
+        partial(render_wordcloud, word_index),
+        version=version,
+        disk_dir=os.path.join(shared_dir, version, "wordclouds")
+    )
+
+# serve.py: load the datasets in the exporter process and publish them for the workers,
+# with the rollups built once here. The word clouds are then rendered once, here, into
+# the export; a worker only renders one itself when it is asked for it before the
+# exporter got to it.
+def export_dashboard_data(shared_dir, version):
+    df, detailed_df, word_index, text_store = load_datasets(version)
+    publish_snapshot(shared_dir, version, df, detailed_df, word_index, text_store,
+                     RollupCube(df), monthly_mentions(detailed_df))
+    shared_wordcloud_cache(shared_dir, version, word_index).warm(all_wordcloud_keys())
+    return version
+
+# serve.py: map the datasets the exporter published instead of parsing the files again
+def attach_dashboard_data(shared_dir, version):
+    version, df, detailed_df, word_index, text_store, cube, mentions = attach_snapshot(shared_dir)
+    wordcloud_cache = shared_wordcloud_cache(shared_dir, version, word_index)
+    return build_snapshot(version, df, detailed_df, word_index, text_store, wordcloud_cache, cube, mentions)
+
+# Set by serve.py: workers attach to the shared export, and the exporter
+# process only imports this module for its loaders (as do the benchmarks,
+# see benchmarks/run_benchmarks.py), so no data store is started there
+SHARED_DIR_ENV = "DASHBOARD_SHARED_DIR"
+ROLE_ENV = "DASHBOARD_ROLE"
+
+# Seconds between worker checks of the shared export's manifest (cheap: one stat)
+SHARED_POLL_INTERVAL = 5
+
+shared_dir = os.environ.get(SHARED_DIR_ENV)
+if shared_dir:
+    store = DataStore(
+        partial(attach_dashboard_data, shared_dir),
+        sources=[manifest_path(shared_dir)],
+        poll_interval=SHARED_POLL_INTERVAL
+    )
+else:
+    # Load the data in the background so the server can start right away,
+    # and swap in new data when the MapReduce output or the reviews change
+    store = DataStore(
+        load_dashboard_data,
+        sources=[args.aggregates or partfilename, metadata_filename, data_filename],
+        poll_interval=args.reload_interval
+    )
+
+# `app.run(debug=True)` starts Werkzeug's reloader: this script runs once as a watcher
+# that only restarts the server on code changes, and again as the serving process
+# (with WERKZEUG_RUN_MAIN set). Only the serving process may load the data.
+def is_reloader_watcher():
+    return __name__ == '__main__' and os.environ.get("WERKZEUG_RUN_MAIN") != "true"
 
-# Get unique years for dropdown
-years = sorted(df["year"].unique())
+if os.environ.get(ROLE_ENV) not in ("exporter", "benchmark") and not is_reloader_watcher():
+    store.start()
+
+# Page shown until the first load has finished; it reloads itself once the data is ready
+def loading_layout():
+    message = "Loading data..." if store.status == "loading" else "Loading the data failed, see the server log."
+    return html.Div([
+        html.H1("Video Games Reviews Dashboard", style={'textAlign': 'center'}),
+        html.P(message, style={'textAlign': 'center'}),
+        dcc.Location(id='loading-location', refresh=True),
+        dcc.Interval(id='loading-interval', interval=2000)
+    ], style={'maxWidth': '1200px', 'margin': '0 auto'})
+
+# Layout is built on every page load, so it always reflects the current data
+def serve_layout():
+    data = store.current()
+    if data is None:
+        return loading_layout()
+    return dashboard_layout(data.years)
 
 # Layout of the app
-app.layout = html.Div([
-    html.H1("Video Games Reviews Dashboard", style={'textAlign': 'center'}),
+def dashboard_layout(years):
+    return html.Div([
+        html.H1("Video Games Reviews Dashboard", style={'textAlign': 'center'}),
     
-    html.Div([
         html.Div([
-            html.H3("Filters", style={'textAlign': 'center'}),
-            html.Label("Select Year Range:"),
-            dcc.RangeSlider(
-                id='year-slider',
-                min=min(years),
-                max=max(years),
-                value=[min(years), max(years)],
-                marks={str(year): str(year) for year in years},
-                step=1
-            ),
+            html.Div([
+                html.H3("Filters", style={'textAlign': 'center'}),
+                html.Label("Select Year Range:"),
+                dcc.RangeSlider(
+                    id='year-slider',
+                    min=min(years),
+                    max=max(years),
+                    value=[min(years), max(years)],
+                    marks={str(year): str(year) for year in years},
+                    step=1
+                ),
             
-            html.Label("Select Rating:"),
-            dcc.RangeSlider(
-                id='rating-slider',
-                min=1,
-                max=5,
-                value=[1, 5],
-                marks={i: str(i) for i in range(1, 6)},
-                step=1
-            ),
-        ], style={'padding': '20px', 'flex': '1'}),
-    ]),
-    
-    html.Div([
+                html.Label("Select Rating:"),
+                dcc.RangeSlider(
+                    id='rating-slider',
+                    min=1,
+                    max=5,
+                    value=[1, 5],
+                    marks={i: str(i) for i in range(1, 6)},
+                    step=1
+                ),
+            ], style={'padding': '20px', 'flex': '1'}),
+        ]),
+    
         html.Div([
-            html.H3("Rating Distribution", style={'textAlign': 'center'}),
-            dcc.Graph(id='rating-pie-chart')
-        ], style={'width': '50%', 'display': 'inline-block'}),
+            html.Div([
+                html.H3("Rating Distribution", style={'textAlign': 'center'}),
+                dcc.Graph(id='rating-pie-chart')
+            ], style={'width': '50%', 'display': 'inline-block'}),
         
+            html.Div([
+                html.H3("Sentiment Distribution", style={'textAlign': 'center'}),
+                dcc.Graph(id='sentiment-pie-chart')
+            ], style={'width': '50%', 'display': 'inline-block'})
+        ]),
+    
+        html.Div([
+            html.H3("Review Count Trends Over Time", style={'textAlign': 'center'}),
+            dcc.Graph(id='yearly-trend-chart')
+        ]),
+    
+        html.Div([
+            html.H3("Rating Trends Over Time", style={'textAlign': 'center'}),
+            dcc.Graph(id='rating-trends-chart')
+        ]),
+    
+        html.Div([
+            html.H3("Top Products by Review Count", style={'textAlign': 'center'}),
+            dcc.Graph(id='top-products-chart')
+        ]),
+    
+        html.Div([
+            html.H3("Brand Mentions Over Time", style={'textAlign': 'center'}),
+            dcc.Graph(id='brand-mentions-chart')
+        ]),
+    
+        html.Div([
+            html.H3("Controller Mentions by Sentiment", style={'textAlign': 'center'}),
+            dcc.Graph(id='controller-sentiment-chart')
+        ]),
+    
         html.Div([
-            html.H3("Sentiment Distribution", style={'textAlign': 'center'}),
-            dcc.Graph(id='sentiment-pie-chart')
-        ], style={'width': '50%', 'display': 'inline-block'})
-    ]),
-    
-    html.Div([
-        html.H3("Review Count Trends Over Time", style={'textAlign': 'center'}),
-        dcc.Graph(id='yearly-trend-chart')
-    ]),
-    
-    html.Div([
-        html.H3("Rating Trends Over Time", style={'textAlign': 'center'}),
-        dcc.Graph(id='rating-trends-chart')
-    ]),
-    
-    html.Div([
-        html.H3("Top Products by Review Count", style={'textAlign': 'center'}),
-        dcc.Graph(id='top-products-chart')
-    ]),
-    
-    html.Div([
-        html.H3("Brand Mentions Over Time", style={'textAlign': 'center'}),
-        dcc.Graph(id='brand-mentions-chart')
-    ]),
-    
-    html.Div([
-        html.H3("Controller Mentions by Sentiment", style={'textAlign': 'center'}),
-        dcc.Graph(id='controller-sentiment-chart')
-    ]),
-    
-    html.Div([
-        html.H3("Word Cloud - Review Text", style={'textAlign': 'center'}),
-        html.Img(id='wordcloud-image', style={'width': '100%'})
-    ]),
-    
-    html.Div([
-        html.H3("Word Cloud - Review Titles", style={'textAlign': 'center'}),
-        html.Img(id='wordcloud-title-image', style={'width': '100%'})
-    ]),
-    
-], style={'maxWidth': '1200px', 'margin': '0 auto'})
+            html.H3("Word Cloud - Review Text", style={'textAlign': 'center'}),
+            html.Img(id='wordcloud-image', style={'width': '100%'})
+        ]),
+    
+        html.Div([
+            html.H3("Word Cloud - Review Titles", style={'textAlign': 'center'}),
+            html.Img(id='wordcloud-title-image', style={'width': '100%'})
+        ]),
+    
+    ], style={'maxWidth': '1200px', 'margin': '0 auto'})
+
+app.layout = serve_layout
+
+# Query result for a snapshot, memoized on (name, inputs, data version)
+def cached_query(data, name, query, *inputs):
+    if query_cache is None:
+        return query(*inputs)
+    return query_cache.get(name, inputs, data.version, lambda: query(*inputs))
+
+# Every figure callback goes through here. With --cache-figures the whole figure is
+# memoized as well, as Plotly JSON, and the size of the answers is sampled per callback.
+# (A figure computed while a reload swaps the snapshot may be stored under the old
+# version; only requests that still started on the old data can get it.)
+def serve_figure(update):
+    @wraps(update)
+    def serve(*inputs):
+        data = store.current()
+        if query_cache is None or not args.cache_figures or data is None:
+            fig = update(*inputs)
+            payload_stats.record(update.__name__, lambda: payload_bytes(fig))
+            return fig
+        figure_json = query_cache.get(update.__name__, inputs, f"{data.version}-{figure_options}",
+                                      lambda: update(*inputs).to_json())
+        payload_stats.record(update.__name__, lambda: len(figure_json))
+        return json.loads(figure_json)
+    return serve
+
+# Hit, miss and eviction counters of this process's query cache
+@app.server.route("/_query-cache")
+def query_cache_stats():
+    return query_cache.stats() if query_cache is not None else {"backend": "off"}
+
+# Figure JSON bytes per callback in this process
+@app.server.route("/_payloads")
+def payload_report():
+    return payload_stats.stats()
+
+# Reload the loading page once the data store has a snapshot
+@callback(
+    Output('loading-location', 'href'),
+    Input('loading-interval', 'n_intervals')
+)
+def reload_when_ready(n_intervals):
+    if store.current() is None:
+        return no_update
+    return app.get_relative_path("/")
 
 # Callback for the rating pie chart
 @callback(
     Output('rating-pie-chart', 'figure'),
     Input('year-slider', 'value')
 )
+@serve_figure
 def update_rating_pie(years_range):
-    filtered_df = df[(df["year"] >= years_range[0]) & (df["year"] <= years_range[1])]
-    rating_counts = filtered_df.groupby("rating")["count"].sum().reset_index()
+    data = store.current()
+    if data is None:
+        raise PreventUpdate
+    
+    rating_counts = cached_query(data, "rating_counts", data.cube.rating_counts, years_range)
     
     fig = px.pie(
         rating_counts, 
@@ -265,9 +579,13 @@ def update_rating_pie(years_range):
     Output('sentiment-pie-chart', 'figure'),
     Input('year-slider', 'value')
 )
+@serve_figure
 def update_sentiment_pie(years_range):
-    filtered_df = df[(df["year"] >= years_range[0]) & (df["year"] <= years_range[1])]
-    sentiment_counts = filtered_df.groupby("sentiment")["count"].sum().reset_index()
+    data = store.current()
+    if data is None:
+        raise PreventUpdate
+    
+    sentiment_counts = cached_query(data, "sentiment_counts", data.cube.sentiment_counts, years_range)
     
     fig = px.pie(
         sentiment_counts, 
@@ -285,9 +603,13 @@ def update_sentiment_pie(years_range):
     Output('yearly-trend-chart', 'figure'),
     Input('year-slider', 'value')
 )
+@serve_figure
 def update_yearly_trend(years_range):
-    filtered_df = df[(df["year"] >= years_range[0]) & (df["year"] <= years_range[1])]
-    yearly_counts = filtered_df.groupby("year")["count"].sum().reset_index()
+    data = store.current()
+    if data is None:
+        raise PreventUpdate
+    
+    yearly_counts = cached_query(data, "yearly_counts", data.cube.yearly_counts, years_range)
     
     fig = px.line(
         yearly_counts, 
@@ -309,9 +631,13 @@ def update_yearly_trend(years_range):
     Output('rating-trends-chart', 'figure'),
     Input('year-slider', 'value')
 )
+@serve_figure
 def update_rating_trends(years_range):
-    filtered_df = df[(df["year"] >= years_range[0]) & (df["year"] <= years_range[1])]
-    rating_trends = filtered_df.groupby(["year", "rating"])["count"].sum().reset_index()
+    data = store.current()
+    if data is None:
+        raise PreventUpdate
+    
+    rating_trends = cached_query(data, "rating_trends", data.cube.rating_trends, years_range)
     
     fig = px.line(
         rating_trends, 
@@ -335,16 +661,14 @@ def update_rating_trends(years_range):
     Output('top-products-chart', 'figure'),
     [Input('year-slider', 'value'), Input('rating-slider', 'value')]
 )
+@serve_figure
 def update_top_products(years_range, rating_range):
-    filtered_df = df[
-        (df["year"] >= years_range[0]) & 
-        (df["year"] <= years_range[1]) &
-        (df["rating"] >= str(rating_range[0])) & 
-        (df["rating"] <= str(rating_range[1]))
-    ]
+    data = store.current()
+    if data is None:
+        raise PreventUpdate
     
-    product_counts = filtered_df.groupby("title")["count"].sum().reset_index()
-    product_counts = product_counts.sort_values("count", ascending=False).head(10)
+    product_counts = cached_query(data, "top_titles", data.cube.top_titles, years_range, rating_range)
+    product_counts["title"] = shorten_labels(product_counts["title"], args.title_chars)
     
     fig = px.bar(
         product_counts,
@@ -368,45 +692,36 @@ def update_top_products(years_range, rating_range):
     Output('brand-mentions-chart', 'figure'),
     Input('year-slider', 'value')
 )
+@serve_figure
 def update_brand_mentions(years_range):
-    filtered_df = detailed_df[
-        (detailed_df["year"] >= years_range[0]) & 
-        (detailed_df["year"] <= years_range[1])
-    ]
+    data = store.current()
+    if data is None:
+        raise PreventUpdate
     
-    filtered_df["year_month"] = pd.to_datetime(filtered_df[["year", "month"]].assign(day=1))
-    mentions_by_month = filtered_df.groupby(pd.Grouper(key="year_month", freq="ME"))[
-        ["mentions_xbox", "mentions_nintendo", "mentions_sony"]
-    ].sum().reset_index()
+    mentions_by_month = cached_query(data, "brand_mentions", data.mentions.brand_mentions, years_range)
     
+    # Dates go out as epoch milliseconds, and each series at most --max-points long
+    months = epoch_ms(mentions_by_month["year_month"])
     fig = go.Figure()
     
-    fig.add_trace(go.Scatter(
-        x=mentions_by_month["year_month"],
-        y=mentions_by_month["mentions_xbox"],
-        mode='lines+markers',
-        name='Xbox',
-        line=dict(color='green')
-    ))
-    
-    fig.add_trace(go.Scatter(
-        x=mentions_by_month["year_month"],
-        y=mentions_by_month["mentions_nintendo"],
-        mode='lines+markers',
-        name='Nintendo',
-        line=dict(color='red')
-    ))
-    
-    fig.add_trace(go.Scatter(
-        x=mentions_by_month["year_month"],
-        y=mentions_by_month["mentions_sony"],
-        mode='lines+markers',
-        name='Sony',
-        line=dict(color='blue')
-    ))
+    for column, name, color in [
+        ("mentions_xbox", "Xbox", "green"),
+        ("mentions_nintendo", "Nintendo", "red"),
+        ("mentions_sony", "Sony", "blue")
+    ]:
+        counts = mentions_by_month[column].to_numpy()
+        keep = lttb_indices(months, counts, args.max_points)
+        fig.add_trace(go.Scatter(
+            x=months[keep],
+            y=counts[keep],
+            mode='lines+markers',
+            name=name,
+            line=dict(color=color)
+        ))
     
     fig.update_layout(
         title="Brand Mentions Over Time",
+        xaxis_type="date",
         xaxis_title="Date",
         yaxis_title="Number of Mentions",
         legend_title="Brand"
@@ -419,15 +734,15 @@ def update_brand_mentions(years_range):
     Output('controller-sentiment-chart', 'figure'),
     Input('year-slider', 'value')
 )
+@serve_figure
 def update_controller_sentiment(years_range):
-    filtered_df = detailed_df[
-        (detailed_df["year"] >= years_range[0]) & 
-        (detailed_df["year"] <= years_range[1]) &
-        (detailed_df["mentions_controller"] == True)
-    ]
+    data = store.current()
+    if data is None:
+        raise PreventUpdate
     
-    filtered_df["year_month"] = pd.to_datetime(filtered_df[["year", "month"]].assign(day=1))
-    sentiment_by_month = filtered_df.groupby([pd.Grouper(key="year_month", freq="ME"), "sentiment"]).size().reset_index(name="count")
+    sentiment_by_month = cached_query(data, "sentiment_mentions", data.mentions.sentiment_mentions, years_range)
+    sentiment_by_month = downsample_frame(sentiment_by_month, "year_month", "count", args.max_points, by="sentiment")
+    sentiment_by_month["year_month"] = epoch_ms(sentiment_by_month["year_month"])
     
     fig = px.line(
         sentiment_by_month,
@@ -439,6 +754,7 @@ def update_controller_sentiment(years_range):
     )
     
     fig.update_layout(
+        xaxis_type="date",
         xaxis_title="Date",
         yaxis_title="Number of Reviews",
         legend_title="Sentiment"
@@ -452,10 +768,12 @@ def update_controller_sentiment(years_range):
     [Input('rating-slider', 'value')]
 )
 def update_wordcloud(rating_range):
-    min_rating, max_rating = rating_range
-    review_text = get_filtered_review_text(detailed_df, min_rating, max_rating, "review_text")
+    data = store.current()
+    if data is None:
+        raise PreventUpdate
     
-    img_str = create_wordcloud(review_text)
+    min_rating, max_rating = rating_range
+    img_str = data.wordcloud_cache.get("review_text", (min_rating, max_rating), WORDCLOUD_MAX_WORDS, WORDCLOUD_SIZE)
     return f'data:image/png;base64,{img_str}'
 
 # Callback for the review title wordcloud
@@ -464,10 +782,12 @@ def update_wordcloud(rating_range):
     [Input('rating-slider', 'value')]
 )
 def update_title_wordcloud(rating_range):
-    min_rating, max_rating = rating_range
-    title_text = get_filtered_review_text(detailed_df, min_rating, max_rating, "title_text")
+    data = store.current()
+    if data is None:
+        raise PreventUpdate
     
-    img_str = create_wordcloud(title_text)
+    min_rating, max_rating = rating_range
+    img_str = data.wordcloud_cache.get("title_text", (min_rating, max_rating), WORDCLOUD_MAX_WORDS, WORDCLOUD_SIZE)
     return f'data:image/png;base64,{img_str}'
 
 # Run the app
@@ -0,0 +1,129 @@
+# Helpers for caching parsed datasets as typed, memory-mappable Feather (Arrow IPC) files
+import hashlib
+import json
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+# Directory the dashboard writes its caches to (next to the data files)
+CACHE_DIR = "data/cache"
+
+# Hash a file's contents in fixed-size blocks so large files never sit in memory
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Describe a source file by its size, modification time and content hash
+def file_signature(path):
+    stat = os.stat(path)
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha1": file_hash(path)
+    }
+
+# Short token that changes whenever any of the source files change
+# (cheap: only size and mtime are looked at)
+def data_version(sources):
+    digest = hashlib.sha1()
+    for path in sources:
+        stat = os.stat(path)
+        digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:12]
+
+# Sidecar file that records which sources a cache was built from
+def meta_path(cache_path):
+    return cache_path + ".meta.json"
+
+def read_cache_meta(cache_path):
+    try:
+        with open(meta_path(cache_path), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_cache_meta(cache_path, meta):
+    tmp_path = meta_path(cache_path) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, meta_path(cache_path))
+
+# Check whether a cache is still valid for its sources.
+# Size and mtime are compared first; the (slow) content hash is only
+# recomputed when the mtime moved but the size did not, so a touched or
+# copied file does not force a rebuild.
+def is_cache_fresh(cache_path, sources, schema):
+    if not os.path.exists(cache_path):
+        return False
+
+    meta = read_cache_meta(cache_path)
+    if meta is None or meta.get("schema") != schema:
+        return False
+
+    recorded = meta.get("sources", {})
+    if sorted(recorded) != sorted(sources):
+        return False
+
+    refreshed = False
+    for path in sources:
+        if not os.path.exists(path):
+            return False
+        stat = os.stat(path)
+        old = recorded[path]
+        if stat.st_size != old["size"]:
+            return False
+        if stat.st_mtime_ns != old["mtime_ns"]:
+            if file_hash(path) != old["sha1"]:
+                return False
+            old["mtime_ns"] = stat.st_mtime_ns
+            refreshed = True
+
+    if refreshed:
+        write_cache_meta(cache_path, meta)
+    return True
+
+# Write a DataFrame as an uncompressed Feather file so it can be memory-mapped later
+def save_frame(df, cache_path, sources, schema):
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+
+    tmp_path = cache_path + ".tmp"
+    df.reset_index(drop=True).to_feather(tmp_path, compression="uncompressed")
+    os.replace(tmp_path, cache_path)
+
+    write_cache_meta(cache_path, {
+        "schema": schema,
+        "sources": {path: file_signature(path) for path in sources}
+    })
+
+# Strings stay Arrow-backed and numeric columns without nulls are converted
+# without copying; only dictionary columns get new (small) code arrays
+def arrow_string_dtype(arrow_type):
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.ArrowDtype(arrow_type)
+    return None
+
+def table_to_frame(table):
+    return table.to_pandas(split_blocks=True, types_mapper=arrow_string_dtype)
+
+# Memory-map a cached Feather file instead of parsing the text sources again.
+# The columns converted without a copy keep pointing into the mapped file.
+def load_frame(cache_path, columns=None):
+    table = feather.read_table(cache_path, columns=columns, memory_map=True)
+    return table_to_frame(table)
+
+# Remove all but the newest `count` version directories under `parent` (besides `keep`).
+# Memory-mapped files stay readable for whoever still maps them.
+def prune_versions(parent, keep, count=2):
+    versions = [
+        entry for entry in os.scandir(parent)
+        if entry.is_dir() and entry.name != keep
+    ]
+    versions.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in versions[count - 1:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
@@ -0,0 +1,70 @@
+# Background loading and hot reload of the dashboard datasets
+import threading
+import time
+import traceback
+
+from data_cache import data_version
+
+# Holds the current dataset snapshot and replaces it when the source files change.
+# `load()` builds a complete new snapshot while the old one keeps serving requests
+# (double buffering); the swap is a single reference assignment, so callbacks that
+# already took the old snapshot finish with it undisturbed.
+class DataStore:
+    def __init__(self, load, sources, poll_interval=60):
+        self.load = load
+        self.sources = sources
+        self.poll_interval = poll_interval
+        self.snapshot = None
+        self.loaded_version = None
+        self.pending_version = None
+        self.status = "loading"
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    # The snapshot callbacks should use, or None while the first load is running
+    def current(self):
+        return self.snapshot
+
+    def source_version(self):
+        try:
+            return data_version(self.sources)
+        except OSError:
+            return None  # a source is missing or being replaced
+
+    def reload(self, version):
+        started = time.perf_counter()
+        try:
+            snapshot = self.load(version)
+        except Exception:
+            traceback.print_exc()
+            self.status = "error" if self.snapshot is None else "ready"
+            return
+        self.snapshot = snapshot
+        self.loaded_version = version
+        self.status = "ready"
+        print(f"Loaded data version {version} in {time.perf_counter() - started:.1f}s")
+
+    def run(self):
+        self.reload(self.source_version())
+        if not self.poll_interval:
+            return
+
+        while not self.stop_event.wait(self.poll_interval):
+            version = self.source_version()
+            if version is None or version == self.loaded_version:
+                self.pending_version = None
+                continue
+            # Only reload once the files have stopped changing for a whole poll interval
+            if version == self.pending_version:
+                self.pending_version = None
+                self.reload(version)
+            else:
+                self.pending_version = version
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="data-store", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
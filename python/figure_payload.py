@@ -0,0 +1,101 @@
+# Smaller figure payloads for the dashboard charts.
+# Long time series are downsampled to about the number of points the chart can show, with
+# Largest-Triangle-Three-Buckets so peaks and dips survive. Dates are sent as epoch
+# milliseconds in float64 arrays, which Plotly serializes as base64 typed arrays like the
+# counts, instead of one ISO string per point. Long bar labels are shortened. The JSON
+# size of the figures each callback returns is sampled, so payload growth shows up.
+import threading
+
+import numpy as np
+import pandas as pd
+from plotly.io.json import to_json_plotly
+
+# Indices of `threshold` points of the line (x, y) chosen by LTTB: the first and last
+# point, and from each bucket in between the point that spans the largest triangle with
+# the previously chosen point and the average of the next bucket
+def lttb_indices(x, y, threshold):
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # Bucket i holds the points [edges[i], edges[i + 1]); the last edge is the final point
+    every = (n - 2) / (threshold - 2)
+    edges = np.floor(np.arange(threshold - 1) * every).astype(np.int64) + 1
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[stop:next_stop].mean()
+        next_y = y[stop:next_stop].mean()
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+# Dates as float64 milliseconds since the epoch (what a Plotly date axis takes as numbers)
+def epoch_ms(dates):
+    return pd.DatetimeIndex(dates).as_unit("ms").asi8.astype(np.float64)
+
+# At most `max_points` rows of a time series frame per `by` group (or of the whole frame),
+# picked by LTTB on the `y` column
+def downsample_frame(df, x, y, max_points, by=None):
+    groups = df.groupby(by, observed=True, sort=False).indices.values() if by else [np.arange(len(df))]
+    keep = [
+        rows[lttb_indices(epoch_ms(df[x].to_numpy()[rows]), df[y].to_numpy()[rows], max_points)]
+        for rows in groups
+    ]
+    if not keep:
+        return df
+    return df.iloc[np.sort(np.concatenate(keep))].reset_index(drop=True)
+
+# Labels cut to `max_chars` characters; a label whose short form would collide with
+# another's is left whole, so no two bars end up on the same category
+def shorten_labels(labels, max_chars):
+    labels = [str(label) for label in labels]
+    short = [label if len(label) <= max_chars else label[:max_chars - 1].rstrip() + "…" for label in labels]
+    seen = {}
+    for label, shortened in zip(labels, short):
+        seen.setdefault(shortened, set()).add(label)
+    return [shortened if len(seen[shortened]) == 1 else label for label, shortened in zip(labels, short)]
+
+# Bytes of the figure JSON per callback: calls, last, largest and total
+# Measuring a figure serializes it a second time, so only the first and then every
+# `measure_every`-th answer of each callback is measured (none with 0); the byte
+# counters cover the measured answers only.
+class PayloadStats:
+    def __init__(self, measure_every=1):
+        self.measure_every = measure_every
+        self.lock = threading.Lock()
+        self.callbacks = {}
+
+    # Count one answer of `name`; measure() returns its size and runs outside the lock
+    def record(self, name, measure):
+        with self.lock:
+            stats = self.callbacks.setdefault(
+                name, {"calls": 0, "measured": 0, "last_bytes": 0, "max_bytes": 0, "total_bytes": 0}
+            )
+            stats["calls"] += 1
+            if not self.measure_every or (stats["calls"] - 1) % self.measure_every:
+                return
+        nbytes = measure()
+        with self.lock:
+            stats["measured"] += 1
+            stats["last_bytes"] = nbytes
+            stats["max_bytes"] = max(stats["max_bytes"], nbytes)
+            stats["total_bytes"] += nbytes
+
+    def stats(self):
+        with self.lock:
+            return {name: dict(stats) for name, stats in self.callbacks.items()}
+
+# Size of a callback's answer as Dash sends it
+def payload_bytes(value):
+    return len(to_json_plotly(value))
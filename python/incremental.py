@@ -0,0 +1,210 @@
+# Incremental (delta) updates instead of re-running everything over the full history.
+# A file of new review lines is counted the way the MapReduce job counts reviews, merged
+# into the typed aggregate store (see aggregate_format.py) and appended to the review
+# JSONL. The watermark, the largest review timestamp merged so far, is kept next to the
+# aggregate store, so lines at or below it (a delta applied twice, an overlapping
+# export) are not counted again. Deltas are expected in timestamp order, like the daily
+# exports.
+#
+# dash_app.py --incremental picks the appended lines up on its next reload and only
+# parses those (see ReviewMark below).
+#
+#   python incremental.py new_reviews.jsonl [--data-dir data]
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from collections import Counter
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from aggregate_format import AGGREGATE_SCHEMA, ensure_typed_aggregates, read_aggregates, write_aggregates
+from jsonl_loader import CATEGORY_COLUMNS, DEFAULT_BATCH_BYTES, iter_line_batches, json_loads
+
+# Key columns of the aggregate, in the order the MapReduce output is sorted by
+KEY_COLUMNS = AGGREGATE_SCHEMA.names[:-1]
+
+# Bytes before the end of the read part of the review file that are hashed, to tell
+# an append from a rewrite without hashing the whole file
+TAIL_BYTES = 1 << 16
+
+def watermark_path(aggregates_path):
+    return aggregates_path + ".watermark.json"
+
+def read_watermark(aggregates_path):
+    try:
+        with open(watermark_path(aggregates_path), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_watermark(aggregates_path, state):
+    tmp_path = watermark_path(aggregates_path) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, watermark_path(aggregates_path))
+
+# Aggregate key of one review as AmazonReviewMapper builds it, or None when the mapper
+# drops the review (short text, unverified purchase, fractional rating). Missing
+# fields take Gson's defaults: 0 for numbers, "null" in the key for strings.
+def mapper_key(review):
+    text = review.get("text")
+    if text is None or len(text) < 10 or not review.get("verified_purchase"):
+        return None
+    rating = review.get("rating") or 0
+    if rating != int(rating):
+        return None
+    dt = datetime.fromtimestamp((review.get("timestamp") or 0) / 1000)
+    sentiment = review.get("sentiment")
+    asin = review.get("asin")
+    return (dt.year, dt.month, "null" if sentiment is None else sentiment, int(rating),
+            "null" if asin is None else asin)
+
+# Largest review timestamp in a file; the first watermark when none was recorded yet
+def max_timestamp(path):
+    watermark = 0
+    for _, lines in iter_line_batches(path):
+        for line in lines:
+            try:
+                watermark = max(watermark, json_loads(line).get("timestamp") or 0)
+            except (ValueError, TypeError, AttributeError):
+                continue
+    return watermark
+
+# Count the delta's reviews newer than the watermark and copy their lines to `lines_path`.
+# Returns the counts in the aggregate's columns, the new watermark and the skipped lines.
+def count_delta(delta_path, watermark, lines_path, batch_bytes=DEFAULT_BATCH_BYTES):
+    counts = Counter()
+    newest = watermark
+    skipped = {"old": 0, "malformed": 0}
+    with open(lines_path, "wb") as out:
+        for _, lines in iter_line_batches(delta_path, batch_bytes):
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    review = json_loads(line)
+                    timestamp = review.get("timestamp") or 0
+                    key = mapper_key(review)
+                except (ValueError, TypeError, AttributeError, OverflowError, OSError):
+                    skipped["malformed"] += 1
+                    continue
+                if timestamp <= watermark:
+                    skipped["old"] += 1
+                    continue
+                newest = max(newest, timestamp)
+                out.write(line if line.endswith(b"\n") else line + b"\n")
+                if key is not None:
+                    counts[key] += 1
+
+    keys = list(counts)
+    delta = pd.DataFrame(keys or None, columns=KEY_COLUMNS)
+    delta["count"] = np.fromiter(counts.values(), dtype=np.int64, count=len(keys))
+    return delta, newest, skipped
+
+# Add the delta's counts to the aggregate rows; equal keys are summed and the rows end
+# up in the MapReduce output's order
+def merge_aggregates(aggregates, delta):
+    aggregates = aggregates.astype({name: object for name in CATEGORY_COLUMNS if name in aggregates})
+    merged = pd.concat([aggregates, delta], ignore_index=True) \
+        .astype({name: dtype for name, dtype in zip(KEY_COLUMNS, ["int16", "int8", object, "int8", object])}) \
+        .groupby(KEY_COLUMNS, sort=True)["count"].sum() \
+        .reset_index()
+    return merged
+
+# Merge one delta file into the aggregate store and the review JSONL.
+# The JSONL is appended first and the watermark is written last, so a run that stopped
+# half way leaves the review file longer than recorded and the next run refuses to go on.
+def apply_delta(delta_path, reviews_path, part_path):
+    aggregates_path = ensure_typed_aggregates(part_path)
+    state = read_watermark(aggregates_path)
+    if state is None:
+        print(f"No watermark recorded yet; reading the latest timestamp from {reviews_path}")
+        state = {"watermark": max_timestamp(reviews_path), "reviews_size": os.path.getsize(reviews_path)}
+    if os.path.getsize(reviews_path) != state["reviews_size"]:
+        raise RuntimeError(
+            f"{reviews_path} is {os.path.getsize(reviews_path)} bytes but {state['reviews_size']} were merged "
+            f"into {aggregates_path}; rebuild the aggregate with a full run before applying deltas"
+        )
+
+    lines_path = reviews_path + ".delta.tmp"
+    delta, watermark, skipped = count_delta(delta_path, state["watermark"], lines_path)
+    print(f"{delta['count'].sum()} new reviews counted in {len(delta)} aggregate rows, "
+          f"skipped {skipped['old']} at or below the watermark and {skipped['malformed']} malformed lines")
+    if os.path.getsize(lines_path) == 0:
+        os.remove(lines_path)
+        return state
+
+    merged = merge_aggregates(read_aggregates(aggregates_path), delta)
+    with open(reviews_path, "ab") as out, open(lines_path, "rb") as lines:
+        shutil.copyfileobj(lines, out)
+    os.remove(lines_path)
+    write_aggregates(merged, aggregates_path)
+
+    state = {"watermark": watermark, "reviews_size": os.path.getsize(reviews_path)}
+    write_watermark(aggregates_path, state)
+    print(f"Merged into {aggregates_path} ({len(merged)} rows); watermark is now {watermark}")
+    return state
+
+# Size of a file up to the end of its last complete line
+def complete_size(path):
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        end = size
+        while end > 0:
+            start = max(0, end - TAIL_BYTES)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                return start + newline + 1
+            end = start
+    return 0
+
+def tail_hash(path, size):
+    with open(path, "rb") as f:
+        f.seek(max(0, size - TAIL_BYTES))
+        return hashlib.sha1(f.read(size - max(0, size - TAIL_BYTES))).hexdigest()
+
+# The part of the review file a dashboard load has read (whole lines only), with the
+# metadata file it looked titles up in. A later mark extends this one when lines were only
+# appended and the metadata is unchanged; then just the new bytes need parsing.
+class ReviewMark:
+    def __init__(self, reviews_path, metadata_path):
+        self.reviews_path = reviews_path
+        self.size = complete_size(reviews_path)
+        self.tail = tail_hash(reviews_path, self.size)
+        stat = os.stat(metadata_path)
+        self.metadata = (metadata_path, stat.st_size, stat.st_mtime_ns)
+
+    def is_extended_by(self, other):
+        return (
+            other.reviews_path == self.reviews_path
+            and other.metadata == self.metadata
+            and other.size > self.size
+            and tail_hash(self.reviews_path, self.size) == self.tail
+        )
+
+# Review rows of two loads in file order; categories first seen in the appended rows go
+# after the existing ones, as one load over the whole file would order them
+def concat_reviews(reviews, appended):
+    columns = {}
+    for name in reviews.columns:
+        if isinstance(reviews[name].dtype, pd.CategoricalDtype):
+            columns[name] = pd.api.types.union_categoricals([reviews[name], appended[name]])
+        else:
+            columns[name] = np.concatenate([reviews[name].to_numpy(), appended[name].to_numpy()])
+    return pd.DataFrame(columns)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Merge new review lines into the aggregate store and the review JSONL")
+    parser.add_argument("delta", help="JSONL file with the new reviews")
+    parser.add_argument("--data-dir", default="data", help="Directory with part-r-00000 and the review JSONL")
+    cli_args = parser.parse_args()
+    apply_delta(
+        cli_args.delta,
+        os.path.join(cli_args.data_dir, "Video_Games_with_sentiment.jsonl"),
+        os.path.join(cli_args.data_dir, "part-r-00000")
+    )
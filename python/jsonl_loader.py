@@ -0,0 +1,343 @@
+# Streaming, bounded-memory readers for the review JSONL files used by the dashboard
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+from keywords import load_keyword_registry
+from text_store import TokenStoreWriter
+from word_index import TEXT_FIELDS, rating_row, rating_rows, tokenize
+
+# Use orjson when it is installed; it parses the same documents several times faster
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# Raw bytes read per batch when no memory cap is given
+DEFAULT_BATCH_BYTES = 64 << 20
+
+# Parsing a batch temporarily needs several times its raw size
+# (the line strings, the decoded dicts and the column lists)
+PARSE_OVERHEAD = 8
+
+# Byte ranges handed to each worker at least, so a slow range does not stall the pool
+CHUNKS_PER_WORKER = 4
+
+# How many malformed line offsets to keep for the report
+MAX_REPORTED_OFFSETS = 10
+
+# Fixed-width columns and their types; year/month are 0 when the timestamp is missing
+NUMERIC_COLUMNS = {
+    "year": np.int16,
+    "month": np.int8,
+    "rating": np.float32,
+}
+CATEGORY_COLUMNS = ["sentiment", "asin"]
+
+# Bitmask of brand mentions (see keywords.py); its width depends on the registry
+MENTIONS_COLUMN = "mentions"
+ALL_COLUMNS = [*NUMERIC_COLUMNS, MENTIONS_COLUMN, *CATEGORY_COLUMNS]
+
+# Work out how many raw bytes to parse at once for a memory cap given in MB
+def batch_bytes_for(max_memory_mb):
+    if not max_memory_mb:
+        return DEFAULT_BATCH_BYTES
+    return max(1 << 20, (max_memory_mb << 20) // PARSE_OVERHEAD)
+
+# Split a file (or its bytes [start, end)) into roughly equal byte ranges that start
+# and end on line boundaries
+def line_aligned_ranges(path, chunks, start=0, end=None):
+    size = os.path.getsize(path) if end is None else end
+    bounds = [start]
+    with open(path, "rb") as file:
+        for i in range(1, chunks):
+            file.seek(start + (size - start) * i // chunks)
+            file.readline()  # move to the start of the next line
+            bounds.append(min(file.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+# Yield (offset, lines) batches of whole lines totalling roughly batch_bytes.
+# Only lines that start before `end` are returned, so neighbouring ranges never overlap.
+def iter_line_batches(path, batch_bytes=DEFAULT_BATCH_BYTES, start=0, end=None):
+    with open(path, "rb") as file:
+        file.seek(start)
+        offset = start
+        while end is None or offset < end:
+            lines = file.readlines(batch_bytes)
+            if not lines:
+                break
+
+            batch_start = offset
+            kept = 0
+            for line in lines:
+                if end is not None and offset >= end:
+                    break
+                offset += len(line)
+                kept += 1
+            yield batch_start, lines[:kept] if kept < len(lines) else lines
+
+# Dictionary-encode a list of strings into int32 codes (-1 for missing values)
+def encode_strings(values):
+    lookup = {}
+    codes = np.empty(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        if value is None:
+            codes[i] = -1
+            continue
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(lookup)
+        codes[i] = code
+    return codes, list(lookup)
+
+# Parse one batch of review lines straight into typed column arrays.
+# The title and text are only kept as token ids into a batch-local vocabulary.
+def parse_review_batch(lines, registry, offset=0):
+    columns = {name: [] for name in ALL_COLUMNS}
+    malformed = 0
+    malformed_offsets = []
+    vocab = {}
+    tokens = {field: [] for field in TEXT_FIELDS}
+    token_lengths = {field: [] for field in TEXT_FIELDS}
+
+    for line in lines:
+        line_offset = offset
+        offset += len(line)
+        if not line.strip():
+            continue
+        try:
+            review = json_loads(line)
+
+            title_text = (review.get("title") or "").lower()
+            review_text = (review.get("text") or "").lower()
+            rating = review.get("rating")
+            timestamp = review.get("timestamp")
+
+            # Convert timestamp to year and month
+            if timestamp:
+                dt = datetime.fromtimestamp(timestamp / 1000)
+                year = dt.year
+                month = dt.month
+            else:
+                year = 0
+                month = 0
+
+            # Combine title and text for keyword search
+            mentions = registry.mask_of(title_text + " " + review_text)
+            rating = float(rating) if rating is not None else np.nan
+        except (ValueError, TypeError, AttributeError, OverflowError, OSError):
+            malformed += 1
+            if len(malformed_offsets) < MAX_REPORTED_OFFSETS:
+                malformed_offsets.append(line_offset)
+            continue
+
+        columns["year"].append(year)
+        columns["month"].append(month)
+        columns["rating"].append(rating)
+        columns[MENTIONS_COLUMN].append(mentions)
+        columns["sentiment"].append(review.get("sentiment"))
+        columns["asin"].append(review.get("asin"))
+
+        # Tokenize once here so the word clouds never re-process the text
+        # (reviews without a 1-5 rating are not part of any word cloud)
+        has_rating = rating_row(rating) is not None
+        for field, text in (("title_text", title_text), ("review_text", review_text)):
+            ids = [vocab.setdefault(word, len(vocab)) for word in tokenize(text)] if has_rating else []
+            tokens[field].extend(ids)
+            token_lengths[field].append(len(ids))
+
+    batch = {
+        "rows": len(columns["year"]),
+        "malformed": malformed,
+        "malformed_offsets": malformed_offsets,
+        "vocab": list(vocab),
+        "tokens": {
+            field: (np.array(tokens[field], dtype=np.int32), np.array(token_lengths[field], dtype=np.int32))
+            for field in TEXT_FIELDS
+        }
+    }
+    for name, dtype in NUMERIC_COLUMNS.items():
+        batch[name] = np.array(columns[name], dtype=dtype)
+    batch[MENTIONS_COLUMN] = np.array(columns[MENTIONS_COLUMN], dtype=registry.dtype)
+    for name in CATEGORY_COLUMNS:
+        batch[name] = encode_strings(columns[name])
+    return batch
+
+# Global dictionary that batch-local category codes are remapped into
+class CategoryEncoder:
+    def __init__(self, categories=()):
+        self.lookup = {value: code for code, value in enumerate(categories)}
+
+    def remap(self, codes, categories):
+        # The trailing -1 keeps missing values missing (codes[i] == -1)
+        mapping = np.array(
+            [self.lookup.setdefault(value, len(self.lookup)) for value in categories] + [-1],
+            dtype=np.int32
+        )
+        return mapping[codes]
+
+    def categories(self):
+        return list(self.lookup)
+
+# Collects parsed batches and assembles the final DataFrame once at the end.
+# Token ids are remapped into one vocabulary and streamed to the token store right away.
+# With a `base_store` the tokens are appended after its reviews, in its vocabulary.
+class ReviewTableBuilder:
+    def __init__(self, registry, text_store_dir, base_store=None):
+        self.numeric_columns = {**NUMERIC_COLUMNS, MENTIONS_COLUMN: registry.dtype}
+        self.chunks = {name: [] for name in ALL_COLUMNS}
+        self.encoders = {name: CategoryEncoder() for name in CATEGORY_COLUMNS}
+        self.vocab = CategoryEncoder(base_store.vocab.to_pylist() if base_store is not None else ())
+        self.text_store = TokenStoreWriter(text_store_dir, base=base_store)
+        self.rows = 0
+        self.malformed = 0
+        self.malformed_offsets = []
+
+    def add(self, batch):
+        self.rows += batch["rows"]
+        self.malformed += batch["malformed"]
+        room = MAX_REPORTED_OFFSETS - len(self.malformed_offsets)
+        self.malformed_offsets.extend(batch["malformed_offsets"][:room])
+        for name in self.numeric_columns:
+            self.chunks[name].append(batch[name])
+        for name in CATEGORY_COLUMNS:
+            self.chunks[name].append(self.encoders[name].remap(*batch[name]))
+        rows = rating_rows(batch["rating"])
+        for field, (tokens, lengths) in batch["tokens"].items():
+            self.text_store.append(field, rows, self.vocab.remap(tokens, batch["vocab"]), lengths)
+
+    def build(self):
+        columns = {}
+        for name, dtype in self.numeric_columns.items():
+            columns[name] = np.concatenate(self.chunks[name]) if self.chunks[name] else np.empty(0, dtype=dtype)
+        for name in CATEGORY_COLUMNS:
+            codes = np.concatenate(self.chunks[name]) if self.chunks[name] else np.empty(0, dtype=np.int32)
+            columns[name] = pd.Categorical.from_codes(codes, categories=self.encoders[name].categories())
+        columns["date"] = month_dates(columns["year"], columns["month"])
+        return pd.DataFrame(columns)
+
+# First day of each review's month (NaT when the timestamp was missing)
+def month_dates(year, month):
+    months = (year.astype(np.int64) - 1970) * 12 + month.astype(np.int64) - 1
+    months[year == 0] = np.iinfo(np.int64).min
+    return months.view("datetime64[M]").astype("datetime64[ns]")
+
+# Parse one byte range of the review file in a worker process
+def parse_review_range(path, byte_range, batch_bytes, registry):
+    start, end = byte_range
+    return [
+        parse_review_batch(lines, registry, offset)
+        for offset, lines in iter_line_batches(path, batch_bytes, start, end)
+    ]
+
+# Results of fn(item, *args) in the order of `items`, with at most `window` items
+# submitted whose results have not been taken yet
+def map_bounded(executor, fn, items, window, *args):
+    pending = deque()
+    for item in items:
+        if len(pending) == window:
+            yield pending.popleft().result()
+        pending.append(executor.submit(fn, item, *args))
+    while pending:
+        yield pending.popleft().result()
+
+# Print how many lines were loaded and where the malformed ones were
+def report_malformed(path, rows, malformed, offsets):
+    if malformed:
+        print(f"Loaded {rows} lines from {path}, skipped {malformed} malformed lines "
+              f"(first at byte offsets {offsets})")
+
+# Stream the review JSONL batch by batch; only one batch of raw lines is alive at a time.
+# Returns the review DataFrame (numeric, flag and category columns only) and the
+# token store of the titles and texts written to `text_store_dir` (see text_store.py).
+# With workers > 1 the file is split into line-aligned byte ranges of at most one worker's
+# share of the batch size, parsed in a process pool with only `workers` ranges in flight,
+# and the per-range column chunks are stitched together without re-parsing or re-copying text.
+# `byte_range` limits the parse to whole lines in [start, end); with a `base_store` their
+# tokens are appended after those of that store (see incremental.py).
+def load_reviews(path, text_store_dir, max_memory_mb=None, workers=1, registry=None,
+                 byte_range=None, base_store=None):
+    registry = registry or load_keyword_registry()
+    builder = ReviewTableBuilder(registry, text_store_dir, base_store)
+    batch_bytes = batch_bytes_for(max_memory_mb)
+    start, end = byte_range or (0, None)
+
+    try:
+        if workers > 1:
+            range_bytes = max(1 << 20, batch_bytes // workers)
+            size = (os.path.getsize(path) if end is None else end) - start
+            ranges = line_aligned_ranges(path, max(workers * CHUNKS_PER_WORKER, -(-size // range_bytes)), start, end)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for batches in map_bounded(executor, partial(parse_review_range, path), ranges, workers,
+                                           range_bytes, registry):
+                    for batch in batches:
+                        builder.add(batch)
+        else:
+            for offset, lines in iter_line_batches(path, batch_bytes, start, end):
+                builder.add(parse_review_batch(lines, registry, offset))
+                del lines
+
+        report_malformed(path, builder.rows, builder.malformed, builder.malformed_offsets)
+        return builder.build(), builder.text_store.close(builder.vocab.categories())
+    except BaseException:
+        # Don't leave the half-written store (and its links to the base's files) behind
+        builder.text_store.abort()
+        raise
+
+# Pull parent_asin -> title out of one byte range of the metadata file.
+# Each record is dropped right after its two fields are read; with `wanted`
+# only the asins in that set are kept.
+def parse_title_range(path, byte_range, wanted=None, batch_bytes=DEFAULT_BATCH_BYTES):
+    start, end = byte_range
+    titles = {}
+    rows = 0
+    malformed = 0
+    malformed_offsets = []
+    for offset, lines in iter_line_batches(path, batch_bytes, start, end):
+        for line in lines:
+            line_offset = offset
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                item = json_loads(line)
+                asin = item["parent_asin"]
+                if wanted is None or asin in wanted:
+                    titles[asin] = item["title"]
+                rows += 1
+            except (ValueError, TypeError, KeyError):
+                malformed += 1
+                if len(malformed_offsets) < MAX_REPORTED_OFFSETS:
+                    malformed_offsets.append(line_offset)
+    return titles, rows, malformed, malformed_offsets
+
+# Build the parent_asin -> title mapping from the metadata JSONL
+def load_title_map(path, workers=1, wanted=None):
+    if workers > 1:
+        ranges = line_aligned_ranges(path, workers * CHUNKS_PER_WORKER)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(parse_title_range, repeat(path), ranges, repeat(wanted)))
+    else:
+        results = [parse_title_range(path, (0, os.path.getsize(path)), wanted)]
+
+    # Ranges are merged in file order, so later duplicates win as before
+    title_map = {}
+    rows = 0
+    malformed = 0
+    malformed_offsets = []
+    for titles, range_rows, range_malformed, range_offsets in results:
+        title_map.update(titles)
+        rows += range_rows
+        malformed += range_malformed
+        malformed_offsets.extend(range_offsets)
+
+    report_malformed(path, rows, malformed, malformed_offsets[:MAX_REPORTED_OFFSETS])
+    return title_map
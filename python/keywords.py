@@ -0,0 +1,82 @@
+# Shared brand/keyword registry: checks each distinct keyword once per review and
+# packs the result into one bitmask per review (bit i set = brand i mentioned)
+import json
+import os
+
+import numpy as np
+
+# brand -> keywords, read from this file when it exists
+KEYWORDS_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "brand_keywords.json")
+
+DEFAULT_BRAND_KEYWORDS = {
+    "xbox": ["microsoft", "xbox"],
+    "nintendo": ["nintendo", "switch"],
+    "sony": ["sony", "playstation"],
+    "controller": ["controller"],
+    "halo": ["halo"],
+}
+
+class KeywordRegistry:
+    def __init__(self, brand_keywords):
+        self.brands = list(brand_keywords)
+        if len(self.brands) > 63:
+            raise ValueError("At most 63 brands fit in a mention bitmask")
+        self.bits = {brand: 1 << i for i, brand in enumerate(self.brands)}
+        self.dtype = next(
+            dtype for dtype in (np.uint8, np.uint16, np.uint32, np.uint64)
+            if len(self.brands) <= np.iinfo(dtype).bits
+        )
+
+        # Mask contributed by each keyword (a keyword can belong to several brands)
+        self.keyword_masks = {}
+        for brand, keywords in brand_keywords.items():
+            for keyword in keywords:
+                keyword = keyword.lower()
+                self.keyword_masks[keyword] = self.keyword_masks.get(keyword, 0) | self.bits[brand]
+
+        # (keyword, mask) pairs checked by mask_of, each keyword once
+        self.keyword_items = list(self.keyword_masks.items())
+
+    # Substring semantics, same as the old `any(kw in text ...)` checks. One `in` per
+    # distinct keyword is faster than a regex alternation: str.find skips ahead in C
+    # while the regex engine tries every keyword at every position.
+    def mask_of(self, text):
+        mask = 0
+        for keyword, keyword_mask in self.keyword_items:
+            if keyword in text:
+                mask |= keyword_mask
+        return mask
+
+    # Boolean flags for one brand out of a bitmask column
+    def flags(self, masks, brand):
+        return (np.asarray(masks) & self.bits[brand]) != 0
+
+    # Spark column holding the bitmask for a lowercased text column.
+    # The text is split into tokens once and every token is looked up in a keyword
+    # map inside the same expression, so no per-brand split or extra shuffle is needed.
+    # Matching is on whole tokens here, as the Spark report always did.
+    # Masks are longs throughout: an int accumulator would lose the bits of brands 32-63.
+    def spark_mask(self, text_col):
+        from pyspark.sql import functions as F
+
+        keyword_map = F.create_map(*[
+            value for keyword, mask in self.keyword_masks.items()
+            for value in (F.lit(keyword), F.lit(mask).cast("long"))
+        ])
+        tokens = F.split(text_col, r"[^a-z0-9']+")
+        return F.aggregate(
+            tokens,
+            F.lit(0).cast("long"),
+            lambda acc, token: acc.bitwiseOR(F.coalesce(keyword_map[token], F.lit(0).cast("long")))
+        )
+
+    # Spark column with 1 when the bitmask contains the brand, else 0
+    def spark_flag(self, mask_col, brand):
+        return (mask_col.bitwiseAND(self.bits[brand]) != 0).cast("int")
+
+# Build the registry from the JSON config, falling back to the built-in keywords
+def load_keyword_registry(path=KEYWORDS_CONFIG):
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return KeywordRegistry(json.load(f))
+    return KeywordRegistry(DEFAULT_BRAND_KEYWORDS)
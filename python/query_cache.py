@@ -0,0 +1,158 @@
+# Memoized callback results (query frames and figure JSON), keyed by filter state.
+# Entries are keyed on (name, inputs, data version) and stored pickled, so a cached
+# frame can never be changed by whoever got it. The memory backend is a per-process
+# LRU; the SQLite backend is one file shared by every worker of serve.py. Both evict
+# the least recently used entries (SQLite: as of TOUCH_INTERVAL) once their total size
+# passes the limit, so entries of an old data version simply age out.
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+QUERY_CACHE_BACKENDS = ["off", "memory", "sqlite"]
+
+# Seconds before a hit on a SQLite entry updates its last use again. A hot entry is
+# written once per interval instead of on every hit; eviction order is only this exact.
+TOUCH_INTERVAL = 60
+
+class MemoryBackend:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    # Returns how many entries were evicted to make room
+    def put(self, key, value):
+        evicted = 0
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, dropped = self.entries.popitem(last=False)
+                self.size -= len(dropped)
+                evicted += 1
+        return evicted
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.size}
+
+# One table in a local SQLite file; each thread has its own connection, and WAL mode
+# lets the workers read while one of them writes
+class SqliteBackend:
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self.connection() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used)")
+
+    def connection(self):
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = self.local.db = sqlite3.connect(self.path, timeout=30)
+        return db
+
+    def get(self, key):
+        with self.connection() as db:
+            row = db.execute("SELECT value, used FROM entries WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is not None and now - row[1] >= TOUCH_INTERVAL:
+                db.execute("UPDATE entries SET used = ? WHERE key = ?", (now, key))
+        return row[0] if row is not None else None
+
+    def put(self, key, value):
+        with self.connection() as db:
+            db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", (key, value, len(value), time.time()))
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            # Oldest entries first, until the rest fits (the new entry is always kept)
+            evict = []
+            for old_key, size in db.execute("SELECT key, size FROM entries WHERE key != ? ORDER BY used", (key,)):
+                if total <= self.max_bytes:
+                    break
+                evict.append((old_key,))
+                total -= size
+            db.executemany("DELETE FROM entries WHERE key = ?", evict)
+        return len(evict)
+
+    def clear(self):
+        with self.connection() as db:
+            db.execute("DELETE FROM entries")
+
+    def stats(self):
+        with self.connection() as db:
+            entries, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"entries": entries, "bytes": size, "path": self.path}
+
+# Hit, miss and eviction counters are kept per process
+class QueryCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # e.g. ("rating_counts", ([2010, 2015],), "3f2a9c01d4e7") -> '["rating_counts", [[2010, 2015]], "3f2a..."]'
+    @staticmethod
+    def make_key(name, inputs, version):
+        return json.dumps([name, inputs, version], default=str)
+
+    # compute() runs outside any lock; two threads missing the same key both compute it
+    def get(self, name, inputs, version, compute):
+        key = self.make_key(name, inputs, version)
+        value = self.backend.get(key)
+        if value is not None:
+            with self.lock:
+                self.hits += 1
+            return pickle.loads(value)
+
+        result = compute()
+        evicted = self.backend.put(key, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+        with self.lock:
+            self.misses += 1
+            self.evictions += evicted
+        return result
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self.lock:
+            counters = {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+        return {**counters, **self.backend.stats(), "backend": type(self.backend).__name__, "pid": os.getpid()}
+
+# Cache for the command line choice, or None when caching is off
+def make_query_cache(backend, max_mb, sqlite_path):
+    if backend == "off":
+        return None
+    if backend == "sqlite":
+        return QueryCache(SqliteBackend(sqlite_path, max_mb << 20))
+    return QueryCache(MemoryBackend(max_mb << 20))
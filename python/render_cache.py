@@ -0,0 +1,104 @@
+# Bounded, memoized cache of rendered images (the dashboard word clouds), keyed by filter state
+import base64
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+# In-memory LRU of base64-encoded PNGs, optionally persisted on disk.
+# `render(*key)` must return the base64 PNG for a key. Entries belong to a
+# data version; changing the version drops everything rendered for the old data.
+class RenderCache:
+    def __init__(self, render, version, max_entries=64, disk_dir=None):
+        self.render = render
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.version = None
+        self.set_version(version)
+
+    # Switch to a new data version, dropping memory entries and stale disk files
+    def set_version(self, version):
+        with self.lock:
+            if version == self.version:
+                return
+            self.version = version
+            self.entries.clear()
+
+        if self.disk_dir:
+            os.makedirs(self.version_dir(), exist_ok=True)
+            for name in os.listdir(self.disk_dir):
+                if name != version:
+                    shutil.rmtree(os.path.join(self.disk_dir, name), ignore_errors=True)
+
+    def version_dir(self):
+        return os.path.join(self.disk_dir, self.version)
+
+    # e.g. ("review_text", (1, 5), 100, (800, 400)) -> review_text_1_5_100_800_400.png
+    def disk_path(self, key):
+        parts = []
+        for part in key:
+            parts.extend(part if isinstance(part, (tuple, list)) else [part])
+        return os.path.join(self.version_dir(), "_".join(str(part) for part in parts) + ".png")
+
+    def get(self, *key):
+        with self.lock:
+            version = self.version
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+
+        img_str = self.read_disk(key)
+        if img_str is None:
+            # Render outside the lock so other keys can still be served meanwhile
+            img_str = self.render(*key)
+            self.write_disk(key, img_str)
+
+        with self.lock:
+            if version == self.version:
+                self.entries[key] = img_str
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return img_str
+
+    def read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self.disk_path(key), "rb") as f:
+                return base64.b64encode(f.read()).decode()
+        except OSError:
+            return None
+
+    def write_disk(self, key, img_str):
+        if not self.disk_dir:
+            return
+        path = self.disk_path(key)
+        # Several processes (serve.py's exporter and workers) may write the same key
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(base64.b64decode(img_str))
+            os.replace(tmp_path, path)
+        except OSError:
+            pass  # the disk copy is only an optimisation
+
+    # Render the given keys ahead of the first visitors; a key that fails is only reported
+    def warm(self, keys):
+        for key in keys:
+            try:
+                self.get(*key)
+            except Exception as e:
+                print(f"Could not pre-render {key}: {e}")
+
+    # Same on a daemon thread, so the first visitors get cache hits
+    def warm_in_background(self, keys):
+        thread = threading.Thread(target=self.warm, args=(keys,), name="render-cache-warmup", daemon=True)
+        thread.start()
+        return thread
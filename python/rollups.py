@@ -0,0 +1,206 @@
+# Precomputed rollups so dashboard callbacks never scan the raw aggregate rows
+import copy
+
+import numpy as np
+import pandas as pd
+
+# Cumulative sums along the first (year) axis with a leading zero slab,
+# so the total over years [i, j) is prefix[j] - prefix[i]
+def prefix_sums(counts, dtype=np.int64):
+    prefix = np.zeros((counts.shape[0] + 1,) + counts.shape[1:], dtype=dtype)
+    np.cumsum(counts, axis=0, dtype=dtype, out=prefix[1:])
+    return prefix
+
+# Sum `weights` into a dense array indexed by the given integer code columns.
+# Only the occupied cells are summed, so no full-size float buffer is needed.
+def dense_counts(codes, shape, weights, dtype=np.int64):
+    flat = np.ravel_multi_index(codes, shape)
+    cells, inverse = np.unique(flat, return_inverse=True)
+    counts = np.zeros(int(np.prod(shape)), dtype=dtype)
+    counts[cells] = np.bincount(inverse, weights=weights).round()
+    return counts.reshape(shape)
+
+# Positions of `labels` in alphabetical order. Sentiments are listed that way, as the
+# groupby on the string column did, not in the order their categories were first seen,
+# so the charts keep their trace order and colours.
+def sorted_order(labels):
+    return np.argsort(np.asarray(labels, dtype=object), kind="stable")
+
+# Year x rating x sentiment and year x rating x title counts built once from the
+# aggregated DataFrame. Year-range queries are answered with prefix-sum differences.
+class RollupCube:
+    def __init__(self, df):
+        self.first_year = int(df["year"].min())
+        self.years = np.arange(self.first_year, int(df["year"].max()) + 1)
+        self.ratings = df["rating"].cat.categories
+        self.sentiments = df["sentiment"].cat.categories
+        self.titles = df["title"].cat.categories
+
+        year_idx = df["year"].to_numpy().astype(np.int64) - self.first_year
+        rating_idx = df["rating"].cat.codes.to_numpy()
+        sentiment_idx = df["sentiment"].cat.codes.to_numpy()
+        title_idx = df["title"].cat.codes.to_numpy()
+        counts = df["count"].to_numpy()
+
+        valid = (rating_idx >= 0) & (sentiment_idx >= 0)
+        self.rating_sentiment = dense_counts(
+            (year_idx[valid], rating_idx[valid], sentiment_idx[valid]),
+            (len(self.years), len(self.ratings), len(self.sentiments)),
+            counts[valid]
+        )
+        self.rating_sentiment_prefix = prefix_sums(self.rating_sentiment)
+
+        # Rows without a title are left out, like the groupby on "title" did
+        valid = (rating_idx >= 0) & (title_idx >= 0)
+        title_counts = dense_counts(
+            (year_idx[valid], rating_idx[valid], title_idx[valid]),
+            (len(self.years), len(self.ratings), len(self.titles)),
+            counts[valid],
+            dtype=np.int32
+        )
+        self.title_prefix = prefix_sums(title_counts, dtype=np.int32)
+
+    # Convert an inclusive [min_year, max_year] range into cube row bounds [start, stop)
+    def year_bounds(self, years_range):
+        start = int(np.clip(years_range[0] - self.first_year, 0, len(self.years)))
+        stop = int(np.clip(years_range[1] - self.first_year + 1, start, len(self.years)))
+        return start, stop
+
+    # Convert an inclusive rating range into category bounds (ratings compare as strings)
+    def rating_bounds(self, rating_range):
+        start = self.ratings.searchsorted(str(rating_range[0]), side="left")
+        stop = self.ratings.searchsorted(str(rating_range[1]), side="right")
+        return start, max(start, stop)
+
+    def rating_counts(self, years_range):
+        start, stop = self.year_bounds(years_range)
+        totals = (self.rating_sentiment_prefix[stop] - self.rating_sentiment_prefix[start]).sum(axis=1)
+        counts = pd.DataFrame({"rating": self.ratings, "count": totals})
+        return counts[counts["count"] > 0].reset_index(drop=True)
+
+    def sentiment_counts(self, years_range):
+        start, stop = self.year_bounds(years_range)
+        totals = (self.rating_sentiment_prefix[stop] - self.rating_sentiment_prefix[start]).sum(axis=0)
+        order = sorted_order(self.sentiments)
+        counts = pd.DataFrame({"sentiment": self.sentiments[order], "count": totals[order]})
+        return counts[counts["count"] > 0].reset_index(drop=True)
+
+    def yearly_counts(self, years_range):
+        start, stop = self.year_bounds(years_range)
+        totals = self.rating_sentiment[start:stop].sum(axis=(1, 2))
+        counts = pd.DataFrame({"year": self.years[start:stop], "count": totals})
+        return counts[counts["count"] > 0].reset_index(drop=True)
+
+    def rating_trends(self, years_range):
+        start, stop = self.year_bounds(years_range)
+        totals = self.rating_sentiment[start:stop].sum(axis=2)
+        trends = pd.DataFrame({
+            "year": np.repeat(self.years[start:stop], len(self.ratings)),
+            "rating": np.tile(self.ratings, stop - start),
+            "count": totals.ravel()
+        })
+        return trends[trends["count"] > 0].reset_index(drop=True)
+
+    def top_titles(self, years_range, rating_range, n=10):
+        year_start, year_stop = self.year_bounds(years_range)
+        rating_start, rating_stop = self.rating_bounds(rating_range)
+        totals = (
+            self.title_prefix[year_stop, rating_start:rating_stop].astype(np.int64)
+            - self.title_prefix[year_start, rating_start:rating_stop]
+        ).sum(axis=0)
+
+        if len(totals) > n:
+            candidates = np.argpartition(-totals, n)[:n]
+        else:
+            candidates = np.arange(len(totals))
+        top = candidates[np.argsort(-totals[candidates], kind="stable")]
+        top = top[totals[top] > 0]
+        return pd.DataFrame({"title": self.titles[top], "count": totals[top]})
+
+# Month x brand mention counts and month x sentiment counts for one brand, built once
+# from the review rows. The time-series callbacks slice the months of the selected
+# years, so their cost no longer depends on the number of reviews.
+class MonthlyMentions:
+    def __init__(self, detailed_df, registry, brands=("xbox", "nintendo", "sony"), sentiment_brand="controller"):
+        years = detailed_df["year"].to_numpy().astype(np.int64)
+        dated = years > 0  # year 0 marks a missing timestamp
+        self.first_year = int(years[dated].min()) if dated.any() else 0
+        n_months = (int(years[dated].max()) - self.first_year + 1) * 12 if dated.any() else 0
+        # Month-end labels, as the resampling with freq="ME" produced
+        self.months = pd.date_range(f"{max(self.first_year, 1970)}-01-31", periods=n_months, freq="ME")
+
+        month_idx = (years[dated] - self.first_year) * 12 + detailed_df["month"].to_numpy()[dated].astype(np.int64) - 1
+        masks = detailed_df["mentions"].to_numpy()[dated]
+
+        self.reviews = np.bincount(month_idx, minlength=n_months)
+        self.brands = list(brands)
+        self.brand_counts = {
+            brand: np.bincount(month_idx, weights=registry.flags(masks, brand), minlength=n_months).astype(np.int64)
+            for brand in self.brands
+        }
+
+        self.sentiments = detailed_df["sentiment"].cat.categories
+        sentiment_idx = detailed_df["sentiment"].cat.codes.to_numpy()[dated]
+        selected = registry.flags(masks, sentiment_brand) & (sentiment_idx >= 0)
+        self.sentiment_counts = dense_counts(
+            (month_idx[selected], sentiment_idx[selected]),
+            (n_months, len(self.sentiments)),
+            None
+        )
+
+    # Series of these reviews and `other`'s (later) reviews together, the same as one
+    # MonthlyMentions over both; new sentiments are added after the existing ones
+    def merged(self, other):
+        parts = [part for part in (self, other) if len(part.months)]
+        merged = copy.copy(self)
+        merged.sentiments = self.sentiments.append(other.sentiments.difference(self.sentiments, sort=False))
+        if parts:
+            merged.first_year = min(part.first_year for part in parts)
+            last_year = max(part.first_year + len(part.months) // 12 - 1 for part in parts)
+            n_months = (last_year - merged.first_year + 1) * 12
+        else:
+            n_months = 0
+        merged.months = pd.date_range(f"{max(merged.first_year, 1970)}-01-31", periods=n_months, freq="ME")
+
+        merged.reviews = np.zeros(n_months, dtype=np.int64)
+        merged.brand_counts = {brand: np.zeros(n_months, dtype=np.int64) for brand in self.brands}
+        merged.sentiment_counts = np.zeros((n_months, len(merged.sentiments)), dtype=np.int64)
+        for part in parts:
+            months = slice((part.first_year - merged.first_year) * 12,
+                           (part.first_year - merged.first_year) * 12 + len(part.months))
+            merged.reviews[months] += part.reviews
+            for brand in self.brands:
+                merged.brand_counts[brand][months] += part.brand_counts[brand]
+            columns = merged.sentiments.get_indexer(part.sentiments)
+            merged.sentiment_counts[months, columns] += part.sentiment_counts
+        return merged
+
+    # Month bounds [start, stop) for an inclusive year range, trimmed to the first and
+    # last month that has reviews (the resampled series started and ended there too)
+    def month_bounds(self, years_range):
+        n_months = len(self.months)
+        start = int(np.clip((years_range[0] - self.first_year) * 12, 0, n_months))
+        stop = int(np.clip((years_range[1] - self.first_year + 1) * 12, start, n_months))
+        occupied = np.flatnonzero(self.reviews[start:stop])
+        if len(occupied) == 0:
+            return start, start
+        return start + int(occupied[0]), start + int(occupied[-1]) + 1
+
+    # One row per month with a mentions_<brand> column per brand
+    def brand_mentions(self, years_range):
+        start, stop = self.month_bounds(years_range)
+        return pd.DataFrame({
+            "year_month": self.months[start:stop],
+            **{f"mentions_{brand}": self.brand_counts[brand][start:stop] for brand in self.brands}
+        })
+
+    # (month, sentiment, count) rows for the sentiment brand, without empty combinations
+    def sentiment_mentions(self, years_range):
+        start, stop = self.month_bounds(years_range)
+        order = sorted_order(self.sentiments)
+        counts = pd.DataFrame({
+            "year_month": np.repeat(self.months[start:stop], len(self.sentiments)),
+            "sentiment": np.tile(self.sentiments[order], stop - start),
+            "count": self.sentiment_counts[start:stop][:, order].ravel()
+        })
+        return counts[counts["count"] > 0].reset_index(drop=True)
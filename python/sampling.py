@@ -0,0 +1,179 @@
+# Shared sampling for the text analytics of dash_app.py and spark_codes.py.
+# Reviews can be kept by fraction, as one fixed-size uniform sample or as a fixed
+# number per rating, reproducibly with a seed. Word totals
+# estimated from a sample come with standard errors so the accuracy is visible.
+import math
+import os
+
+import numpy as np
+
+SAMPLE_MODES = ["none", "fraction", "uniform", "stratified"]
+
+# z value of the 95% margins printed by report_top_words
+MARGIN_Z = 1.96
+
+# Top words listed by report_top_words
+REPORTED_WORDS = 10
+
+def add_sampling_arguments(parser, default_mode="none"):
+    parser.add_argument(
+        "--sample-mode",
+        choices=SAMPLE_MODES,
+        default=default_mode,
+        help="Reviews used for the word frequencies: none (all), fraction, "
+             "uniform (a fixed number in total) or stratified (a fixed number per rating)"
+    )
+    parser.add_argument(
+        "--sample-fraction",
+        type=float,
+        default=0.1,
+        help="Fraction of reviews kept with --sample-mode fraction"
+    )
+    parser.add_argument(
+        "--sample-size",
+        type=int,
+        default=100000,
+        help="Reviews kept with --sample-mode uniform (in total) or stratified (per rating)"
+    )
+    parser.add_argument(
+        "--sample-seed",
+        type=int,
+        default=None,
+        help="Seed for the sample, so a run can be reproduced"
+    )
+
+class SampleConfig:
+    def __init__(self, mode="none", fraction=0.1, size=100000, seed=None):
+        if mode not in SAMPLE_MODES:
+            raise ValueError(f"Unknown sample mode {mode!r}, expected one of {SAMPLE_MODES}")
+        if mode == "fraction" and not 0 < fraction <= 1:
+            raise ValueError(f"Sample fraction must be in (0, 1], got {fraction}")
+        if mode in ("uniform", "stratified") and size < 1:
+            raise ValueError(f"Sample size must be positive, got {size}")
+        self.mode = mode
+        self.fraction = fraction
+        self.size = size
+        self.seed = seed
+        # Stands in for the seed in key(): an unseeded sample is a new draw on every run
+        self.draw = os.urandom(4).hex()
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(args.sample_mode, args.sample_fraction, args.sample_size, args.sample_seed)
+
+    @property
+    def active(self):
+        return self.mode != "none"
+
+    def describe(self):
+        description = {
+            "none": "all reviews",
+            "fraction": f"{self.fraction:.1%} of reviews",
+            "uniform": f"{self.size} reviews",
+            "stratified": f"{self.size} reviews per rating",
+        }[self.mode]
+        if self.active and self.seed is not None:
+            description += f", seed {self.seed}"
+        return description
+
+    # Names the sample in the keys of results cached from it, e.g. "fraction-0.1-seed7"
+    def key(self):
+        if not self.active:
+            return "all"
+        amount = self.fraction if self.mode == "fraction" else self.size
+        seed = f"seed{self.seed}" if self.seed is not None else f"unseeded{self.draw}"
+        return f"{self.mode}-{amount}-{seed}"
+
+    # Sorted indices of the sampled items of each stratum, for strata of the given sizes
+    def indices(self, sizes):
+        sizes = [int(size) for size in sizes]
+        rng = np.random.default_rng(self.seed)
+
+        if self.mode == "none":
+            return [np.arange(size) for size in sizes]
+        if self.mode == "fraction":
+            return [np.flatnonzero(rng.random(size) < self.fraction) for size in sizes]
+        if self.mode == "stratified":
+            return [np.sort(rng.choice(size, min(self.size, size), replace=False)) for size in sizes]
+
+        # One uniform sample over all strata, split back into the strata
+        total = sum(sizes)
+        picked = np.sort(rng.choice(total, min(self.size, total), replace=False))
+        bounds = np.cumsum([0] + sizes)
+        return [
+            picked[(picked >= start) & (picked < stop)] - start
+            for start, stop in zip(bounds, bounds[1:])
+        ]
+
+    # The same sample of a Spark DataFrame. `populations` maps each value of
+    # `stratum_col` to its row count (needed for the per-rating fractions).
+    def spark_sample(self, df, stratum_col, populations):
+        from pyspark.sql import functions as F
+
+        if self.mode == "none":
+            return df
+        if self.mode == "fraction":
+            return df.sample(False, self.fraction, self.seed)
+        if self.mode == "stratified":
+            fractions = {stratum: min(1.0, self.size / count) for stratum, count in populations.items() if count}
+            return df.sampleBy(stratum_col, fractions, self.seed)
+        # The rows with the smallest random keys: a uniform fixed-size sample
+        # that Spark computes with a per-partition top-k instead of a full sort
+        return df.orderBy(F.rand(self.seed)).limit(self.size)
+
+# Estimated totals of a stratum and their variances from the per-word sums and sums of
+# squares of the per-review counts. The sample within a stratum is treated as a simple
+# random sample of its (realised) size, with the finite population correction.
+def stratum_estimates(sums, sumsq, sampled, population):
+    sums = np.asarray(sums, dtype=np.float64)
+    if sampled == 0:
+        return np.zeros_like(sums), np.zeros_like(sums)
+
+    estimate = sums * (population / sampled)
+    if sampled < 2:
+        return estimate, np.zeros_like(sums)
+    sample_variance = (np.asarray(sumsq, dtype=np.float64) - sums * sums / sampled) / (sampled - 1)
+    variance = population * population * (1 - sampled / population) / sampled * sample_variance
+    return estimate, np.maximum(variance, 0)
+
+# Word totals with standard errors from a Spark DataFrame of sampled words.
+# `words_df` has one row per token with the columns (stratum_col, "review_id", "word")
+# and comes from the reviews in `sample_df`; `populations` maps each stratum to its
+# total review count. The sampled sizes are counted from `sample_df` itself: sample
+# and sampleBy only keep about the requested number of rows.
+# Returns the top_n words as {word: (estimate, standard error)}.
+def spark_word_estimates(words_df, sample_df, stratum_col, populations, top_n):
+    from pyspark.sql import functions as F
+
+    realised = sample_df.groupBy(stratum_col).agg(F.count(F.lit(1)).cast("double").alias("sampled"))
+    strata = words_df.sparkSession.createDataFrame(
+        [(stratum, float(count)) for stratum, count in populations.items()],
+        [stratum_col, "population"]
+    ).join(realised, stratum_col)
+    per_review = words_df.groupBy(stratum_col, "review_id", "word").count()
+    per_word = per_review.groupBy(stratum_col, "word").agg(
+        F.sum("count").alias("total"),
+        F.sum(F.col("count") * F.col("count")).alias("total_sq")
+    ).join(F.broadcast(strata), stratum_col)
+
+    # Same formulas as stratum_estimates, applied to every (stratum, word)
+    n, N = F.col("sampled"), F.col("population")
+    sample_variance = (F.col("total_sq") - F.col("total") * F.col("total") / n) / (n - 1)
+    per_word = per_word.select(
+        "word",
+        (F.col("total") * N / n).alias("estimate"),
+        F.when(n > 1, F.greatest(N * N * (1 - n / N) / n * sample_variance, F.lit(0.0)))
+            .otherwise(0.0).alias("variance")
+    )
+    top_words = per_word.groupBy("word").agg(
+        F.sum("estimate").alias("estimate"),
+        F.sum("variance").alias("variance")
+    ).orderBy(F.desc("estimate")).limit(top_n).collect()
+    return {row["word"]: (row["estimate"], math.sqrt(row["variance"])) for row in top_words}
+
+# Print the top estimated words with their 95% margins of error
+def report_top_words(label, sample, words, limit=REPORTED_WORDS):
+    print(f"{label} word frequencies from {sample.describe()} (95% margins):")
+    for word, estimate, std_error in words[:limit]:
+        margin = MARGIN_Z * std_error / estimate if estimate else 0.0
+        print(f"  {word}: {estimate:,.0f} ± {margin:.1%}")
@@ -0,0 +1,151 @@
+# Production server for the dashboard: several gunicorn worker processes that share one
+# copy of the datasets. A separate exporter process loads (and hot-reloads) the data once
+# and publishes it to a shared directory as Arrow IPC files (see shared_data.py); every
+# worker memory-maps that export instead of parsing the files itself.
+#
+#   python serve.py --web-workers 4 --threads 8 --bind 0.0.0.0:8050 [dash_app options]
+#
+# gunicorn is only needed for this entry point (pip install gunicorn);
+# `python dash_app.py` still runs the single-process development server.
+import argparse
+import os
+import subprocess
+import sys
+import time
+from functools import partial
+
+from data_store import DataStore
+from shared_data import SHARED_DIR, manifest_path
+
+# Same names as in dash_app.py (not imported: the server process must not load the app)
+SHARED_DIR_ENV = "DASHBOARD_SHARED_DIR"
+ROLE_ENV = "DASHBOARD_ROLE"
+
+# Command line options (unknown arguments are left for dash_app.py, e.g. --workers)
+parser = argparse.ArgumentParser(description="Serve the Video Games Reviews Dashboard with gunicorn")
+parser.add_argument(
+    "--web-workers",
+    type=int,
+    default=os.cpu_count() or 1,
+    help="Number of gunicorn worker processes"
+)
+parser.add_argument(
+    "--threads",
+    type=int,
+    default=4,
+    help="Request threads per worker process"
+)
+parser.add_argument(
+    "--bind",
+    default="127.0.0.1:8050",
+    help="Address the server listens on"
+)
+parser.add_argument(
+    "--timeout",
+    type=int,
+    default=120,
+    help="Seconds a request may take before its worker is restarted"
+)
+parser.add_argument(
+    "--shared-dir",
+    default=SHARED_DIR,
+    help="Directory the loaded datasets are exported to for the workers (use /dev/shm to keep it in memory)"
+)
+# Set on the exporter process serve.py starts itself
+parser.add_argument("--export-only", action="store_true", help=argparse.SUPPRESS)
+
+# Exporter process: load the data with dash_app's loaders, publish it, and publish
+# again whenever the source files change (dash_app's --reload-interval)
+def run_exporter(shared_dir):
+    os.environ[ROLE_ENV] = "exporter"
+    os.environ.pop(SHARED_DIR_ENV, None)
+    import dash_app
+
+    exporter = DataStore(
+        partial(dash_app.export_dashboard_data, shared_dir),
+        sources=dash_app.store.sources,
+        poll_interval=dash_app.args.reload_interval
+    )
+    exporter.run()
+
+# The exporter is a plain child process running this script with --export-only: a fresh
+# interpreter that shares no state with the forked workers, may start its own parsing
+# pool (dash_app's --workers), and is not in multiprocessing's child list, which every
+# exiting gunicorn worker would otherwise try to terminate or join
+def start_exporter():
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--export-only"])
+
+# Stop the exporter when the server shuts down
+def stop_exporter(exporter, timeout=10):
+    if exporter.poll() is not None:
+        return
+    exporter.terminate()
+    try:
+        exporter.wait(timeout)
+    except subprocess.TimeoutExpired:
+        exporter.kill()
+        exporter.wait()
+
+# Wait until the exporter has published a first version; returns False if it died first
+def wait_for_export(shared_dir, exporter):
+    while not os.path.exists(manifest_path(shared_dir)):
+        if exporter.poll() is not None:
+            return False
+        time.sleep(1)
+    return True
+
+def run_gunicorn(options):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        sys.exit("serve.py needs gunicorn: pip install gunicorn")
+
+    class DashboardApplication(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        # Runs in each worker after the fork, so every worker starts its own
+        # data store thread that attaches to the shared export
+        def load(self):
+            from dash_app import app
+            return app.server
+
+    DashboardApplication(options).run()
+
+def main():
+    args, _ = parser.parse_known_args()
+    shared_dir = os.path.abspath(args.shared_dir)
+    if args.export_only:
+        run_exporter(shared_dir)
+        return
+
+    # A manifest left by an earlier run may name an export in an older layout;
+    # the workers wait for this run's first export instead
+    if os.path.exists(manifest_path(shared_dir)):
+        os.remove(manifest_path(shared_dir))
+    exporter = start_exporter()
+    try:
+        print(f"Loading the datasets into {shared_dir}...")
+        if not wait_for_export(shared_dir, exporter):
+            sys.exit("Loading the datasets failed, see the log above.")
+
+        os.environ[SHARED_DIR_ENV] = shared_dir
+        run_gunicorn({
+            "bind": args.bind,
+            "workers": args.web_workers,
+            "threads": args.threads,
+            "worker_class": "gthread",
+            "timeout": args.timeout,
+            # Each worker imports the app itself and maps the data; nothing large is forked
+            "preload_app": False
+        })
+    finally:
+        stop_exporter(exporter)
+
+if __name__ == '__main__':
+    main()
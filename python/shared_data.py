@@ -0,0 +1,138 @@
+# Datasets exported once for several dashboard worker processes to memory-map.
+# serve.py loads the data in one process and writes it here as uncompressed Arrow IPC
+# and .npy files; every WSGI worker maps the same files, so the pages are shared by
+# the OS page cache instead of each worker holding its own copy of the data.
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from data_cache import prune_versions, table_to_frame
+from rollups import MonthlyMentions, RollupCube
+from text_store import TokenStore
+from word_index import TEXT_FIELDS, WordFrequencyIndex
+
+# Default export directory (next to the other caches)
+SHARED_DIR = "data/cache/shared"
+
+# Small file naming the current export; workers watch it for changes
+MANIFEST_FILE = "current.json"
+
+def manifest_path(shared_dir):
+    return os.path.join(shared_dir, MANIFEST_FILE)
+
+def read_manifest(shared_dir):
+    with open(manifest_path(shared_dir), "r") as f:
+        return json.load(f)
+
+# Write a DataFrame as an uncompressed Arrow IPC file
+def write_table(df, path):
+    table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+# Memory-map an Arrow IPC file; the returned table references the mapped pages
+def read_table(path):
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+def save_word_index(word_index, directory):
+    for field in TEXT_FIELDS:
+        np.save(os.path.join(directory, f"{field}.counts.npy"), word_index.matrix[field])
+        write_table(pd.DataFrame({"word": pd.arrays.ArrowExtensionArray(word_index.vocab[field])}),
+                    os.path.join(directory, f"{field}.vocab.arrow"))
+
+def attach_word_index(directory):
+    word_index = WordFrequencyIndex()
+    for field in TEXT_FIELDS:
+        word_index.matrix[field] = np.load(os.path.join(directory, f"{field}.counts.npy"), mmap_mode="r")
+        word_index.vocab[field] = read_table(os.path.join(directory, f"{field}.vocab.arrow")).column("word")
+    return word_index
+
+# The rollup arrays are saved as they are; the labels go to a small JSON file, except
+# the cube's categories, which are those of the exported aggregate's columns
+def save_rollups(cube, mentions, directory):
+    for name in ("rating_sentiment", "rating_sentiment_prefix", "title_prefix"):
+        np.save(os.path.join(directory, f"cube.{name}.npy"), getattr(cube, name))
+    np.save(os.path.join(directory, "mentions.reviews.npy"), mentions.reviews)
+    np.save(os.path.join(directory, "mentions.brand_counts.npy"),
+            np.stack([mentions.brand_counts[brand] for brand in mentions.brands]))
+    np.save(os.path.join(directory, "mentions.sentiment_counts.npy"), mentions.sentiment_counts)
+    with open(os.path.join(directory, "rollups.json"), "w") as f:
+        json.dump({
+            "cube_first_year": cube.first_year,
+            "mentions_first_year": mentions.first_year,
+            "brands": mentions.brands,
+            "sentiments": list(mentions.sentiments)
+        }, f)
+
+def attach_rollups(directory, df):
+    with open(os.path.join(directory, "rollups.json"), "r") as f:
+        labels = json.load(f)
+
+    def load(name):
+        return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+
+    cube = RollupCube.__new__(RollupCube)
+    cube.first_year = labels["cube_first_year"]
+    cube.ratings = df["rating"].cat.categories
+    cube.sentiments = df["sentiment"].cat.categories
+    cube.titles = df["title"].cat.categories
+    cube.rating_sentiment = load("cube.rating_sentiment")
+    cube.rating_sentiment_prefix = load("cube.rating_sentiment_prefix")
+    cube.title_prefix = load("cube.title_prefix")
+    cube.years = np.arange(cube.first_year, cube.first_year + len(cube.rating_sentiment))
+
+    mentions = MonthlyMentions.__new__(MonthlyMentions)
+    mentions.first_year = labels["mentions_first_year"]
+    mentions.reviews = load("mentions.reviews")
+    mentions.months = pd.date_range(f"{max(mentions.first_year, 1970)}-01-31",
+                                    periods=len(mentions.reviews), freq="ME")
+    mentions.brands = labels["brands"]
+    mentions.brand_counts = dict(zip(mentions.brands, load("mentions.brand_counts")))
+    mentions.sentiments = pd.Index(labels["sentiments"])
+    mentions.sentiment_counts = load("mentions.sentiment_counts")
+    return cube, mentions
+
+# Export one loaded version and point the manifest at it.
+# Files are written to a temporary directory that is renamed into place, and the
+# manifest is replaced last, so a worker never sees a half-written export.
+def publish_snapshot(shared_dir, version, df, detailed_df, word_index, text_store, cube, mentions):
+    os.makedirs(shared_dir, exist_ok=True)
+    directory = os.path.join(shared_dir, version)
+    tmp_dir = directory + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    write_table(df, os.path.join(tmp_dir, "aggregate.arrow"))
+    write_table(detailed_df, os.path.join(tmp_dir, "reviews.arrow"))
+    save_word_index(word_index, tmp_dir)
+    save_rollups(cube, mentions, tmp_dir)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_dir, directory)
+
+    tmp_manifest = manifest_path(shared_dir) + ".tmp"
+    with open(tmp_manifest, "w") as f:
+        # The token store is already on disk and is mapped where it is
+        json.dump({"version": version, "text_store": os.path.abspath(text_store.directory)}, f)
+    os.replace(tmp_manifest, manifest_path(shared_dir))
+
+    # Workers may still serve the previous export while they attach to this one
+    prune_versions(shared_dir, keep=version)
+    return version
+
+# Map the export named by the manifest. Returns (version, aggregate DataFrame,
+# review DataFrame, word-frequency index, token store, rollup cube, monthly mentions).
+def attach_snapshot(shared_dir):
+    manifest = read_manifest(shared_dir)
+    version = manifest["version"]
+    directory = os.path.join(shared_dir, version)
+    df = table_to_frame(read_table(os.path.join(directory, "aggregate.arrow")))
+    detailed_df = table_to_frame(read_table(os.path.join(directory, "reviews.arrow")))
+    cube, mentions = attach_rollups(directory, df)
+    return (version, df, detailed_df, attach_word_index(directory), TokenStore(manifest["text_store"]),
+            cube, mentions)
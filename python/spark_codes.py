@@ -3,90 +3,302 @@
 from pyspark.sql import SparkSession
 from pyspark.sql import functions as F
 from pyspark.sql.types import *
-import matplotlib.pyplot as plt
+from pyspark import StorageLevel
 import json
 import re
 import html
-from wordcloud import WordCloud, STOPWORDS
+from wordcloud import STOPWORDS
 from datetime import datetime
+import argparse
 import os
+from keywords import load_keyword_registry
+from spark_stages import StageTimer, save_stage_report, stage_report_html
+from sampling import SampleConfig, add_sampling_arguments, report_top_words, spark_word_estimates
+import chart_render
+
+# Command line options
+parser = argparse.ArgumentParser(description="Video Games Reviews Analysis")
+parser.add_argument(
+    "--wordcloud-mode",
+    choices=["distributed", "sample"],
+    default="distributed",
+    help="distributed: count words on the executors; "
+         "sample: collect the sampled text to the driver (a 10%% sample unless --sample-mode is given)"
+)
+parser.add_argument(
+    "--part-parser",
+    choices=["dataframe", "rdd"],
+    default="dataframe",
+    help="How part-r-00000 is parsed when there is no typed copy: dataframe (CSV reader "
+         "with an explicit schema, in the JVM) or rdd (the old Python parse_line map)"
+)
+parser.add_argument(
+    "--data-dir",
+    default="/home/hadoop",
+    help="Directory with part-r-00000 and the JSONL files (e.g. synthetic data from "
+         "benchmarks/generate_data.py for a local-mode run)"
+)
+parser.add_argument(
+    "--output-dir",
+    default="visualization_output",
+    help="Directory the charts, the aggregates and the reports are written to"
+)
+parser.add_argument(
+    "--render-workers",
+    type=int,
+    default=min(8, os.cpu_count() or 1),
+    help="Processes the charts and word clouds are rendered in, while the driver goes on "
+         "with the Spark jobs of the later charts"
+)
+# Word clouds can be built from a sample of the reviews (see sampling.py)
+add_sampling_arguments(parser)
+args, _ = parser.parse_known_args()
+sample = SampleConfig.from_args(args)
+
+# Words drawn in each word cloud (WordCloud's default)
+WORDCLOUD_MAX_WORDS = 200
 
 # Create output directory for saved visualizations
-output_dir = "visualization_output"
+output_dir = args.output_dir
 os.makedirs(output_dir, exist_ok=True)
 
+# Chart rendering pool (see chart_render.py); started before the Spark session
+render_pool = chart_render.start_render_pool(args.render_workers)
+renders = []
+
+# Render one figure into the output directory in the pool
+def submit_render(render, filename, *render_args):
+    renders.append(render_pool.submit(render, os.path.join(output_dir, filename), *render_args))
+
 # Initialize Spark session
 spark = SparkSession.builder \
     .appName("Video Games Reviews Analysis") \
     .getOrCreate()
 
+# Wall time, jobs, input rows and shuffle bytes of each named stage below
+# (written to stage_report.json and to the HTML report)
+timer = StageTimer(spark)
+
 # FILE PATHS
-partfilename = "/home/hadoop/part-r-00000"
-metadata_filename = "/home/hadoop/meta_Video_Games.jsonl"
-data_filename = "/home/hadoop/Video_Games_with_sentiment.jsonl"
+partfilename = os.path.join(args.data_dir, "part-r-00000")
+metadata_filename = os.path.join(args.data_dir, "meta_Video_Games.jsonl")
+data_filename = os.path.join(args.data_dir, "Video_Games_with_sentiment.jsonl")
+title_lookup_filename = os.path.join(args.data_dir, "title_lookup.parquet")
 
 # LOAD DATA
-# Read the part file
-lines_rdd = spark.sparkContext.textFile(partfilename)
-
-# Parse the data
-def parse_line(line):
-    line = line.strip()
-    keys, count = line.split("\t")
-    year, month, sentiment, rating, asid = keys.split("-")
+timer.begin("load_aggregates")
+# Typed copy of the part file written by aggregate_format.py; used when it is up to date
+typed_partfilename = partfilename + ".parquet"
+
+# Modification time of a file or directory on the cluster file system (None if missing)
+def hadoop_mtime(path):
+    hadoop_path = spark._jvm.org.apache.hadoop.fs.Path(path)
+    fs = hadoop_path.getFileSystem(spark._jsc.hadoopConfiguration())
+    if not fs.exists(hadoop_path):
+        return None
+    return fs.getFileStatus(hadoop_path).getModificationTime()
+
+typed_mtime = hadoop_mtime(typed_partfilename)
+if typed_mtime is not None and typed_mtime >= (hadoop_mtime(partfilename) or 0):
+    print(f"Reading typed aggregates {typed_partfilename}")
+    # Same column names and types as the parsed text below
+    df = spark.read.parquet(typed_partfilename).select(
+        F.col("year").cast("long").alias("year"),
+        F.col("month").cast("string").alias("month"),
+        "sentiment",
+        F.col("rating").cast("string").alias("rating"),
+        F.col("asin").alias("asid"),
+        F.col("count").cast("long").alias("count")
+    )
+elif args.part_parser == "dataframe":
+    # Read the tab-separated part file with an explicit schema and split the keys with
+    # a regular expression, so every row stays in the JVM. Year and month come first and
+    # rating and asin last, so a sentiment label containing a dash stays whole.
+    part_schema = StructType([
+        StructField("keys", StringType(), False),
+        StructField("count", LongType(), False)
+    ])
+    key_pattern = r"^([0-9]+)-([0-9]+)-(.*)-([^-]+)-([^-]+)$"
+    keys = F.col("keys")
+    df = spark.read.schema(part_schema).option("sep", "\t").option("quote", "").csv(partfilename).select(
+        F.regexp_extract(keys, key_pattern, 1).cast("long").alias("year"),
+        F.regexp_extract(keys, key_pattern, 2).alias("month"),
+        F.regexp_extract(keys, key_pattern, 3).alias("sentiment"),
+        F.regexp_extract(keys, key_pattern, 4).alias("rating"),
+        F.regexp_extract(keys, key_pattern, 5).alias("asid"),
+        "count"
+    )
+else:
+    # Read the part file
+    lines_rdd = spark.sparkContext.textFile(partfilename)
+
+    # Parse the data
+    def parse_line(line):
+        line = line.strip()
+        keys, count = line.split("\t")
+        year, month, sentiment, rating, asid = keys.split("-")
     
-    return {
-        "year": int(year),
-        "month": month,
-        "sentiment": sentiment,
-        "rating": rating,
-        "asid": asid,
-        "count": int(count)
-    }
-
-# Transform RDD to DataFrame
-data_rdd = lines_rdd.map(parse_line)
-df = spark.createDataFrame(data_rdd)
+        return {
+            "year": int(year),
+            "month": month,
+            "sentiment": sentiment,
+            "rating": rating,
+            "asid": asid,
+            "count": int(count)
+        }
+
+    # Transform RDD to DataFrame
+    data_rdd = lines_rdd.map(parse_line)
+    df = spark.createDataFrame(data_rdd)
 
 # Display sample data (save to log output)
 print("Sample data:")
 df.show(5)
 
 # Load metadata
+timer.begin("title_lookup")
 metadata_schema = StructType([
     StructField("parent_asin", StringType(), True),
-    StructField("title", StringType(), True),
-    # Add other fields as needed
+    StructField("title", StringType(), True)
 ])
 
-# Read metadata file
-metadata_df = spark.read.json(metadata_filename)
-
 # Create mapping: parent_asin → title
-# Select only needed columns to create a lookup dataframe
-title_map_df = metadata_df.select("parent_asin", "title")
+# Reuse the compact lookup saved by an earlier run while the metadata file is unchanged;
+# otherwise read only the two needed fields (no inference over the nested ones),
+# drop duplicate asins and save the lookup for the next run
+lookup_mtime = hadoop_mtime(title_lookup_filename)
+if lookup_mtime is not None and lookup_mtime >= hadoop_mtime(metadata_filename):
+    print(f"Reusing title lookup {title_lookup_filename}")
+else:
+    spark.read.schema(metadata_schema).json(metadata_filename) \
+        .filter(F.col("parent_asin").isNotNull()) \
+        .dropDuplicates(["parent_asin"]) \
+        .write.mode("overwrite").parquet(title_lookup_filename)
+title_map_df = spark.read.parquet(title_lookup_filename)
+
+# Map titles to review DataFrame based on 'asid'; the lookup is small enough to broadcast,
+# so the aggregate is never shuffled for the join
+df = df.join(F.broadcast(title_map_df), df.asid == title_map_df.parent_asin, "left")
+
+timer.begin("read_reviews")
+# Define a schema for the reviews (ratings are stored as 5.0 etc., so they are read as doubles)
+review_schema = StructType([
+    StructField("rating", DoubleType(), True),
+    StructField("title", StringType(), True),
+    StructField("text", StringType(), True),
+    StructField("sentiment", StringType(), True),
+    StructField("asin", StringType(), True),
+    StructField("timestamp", LongType(), True)
+])
 
-# Map titles to review DataFrame based on 'asid'
-df = df.join(title_map_df, df.asid == title_map_df.parent_asin, "left")
+# Read the reviews once with the explicit schema (no inference pass), keep only the
+# columns the charts use and reuse the persisted result for every section below
+reviews_df = spark.read.schema(review_schema).json(data_filename) \
+    .select("rating", "title", "text", "timestamp") \
+    .withColumn("year", F.year(F.from_unixtime(F.col("timestamp") / 1000))) \
+    .withColumn("month", F.month(F.from_unixtime(F.col("timestamp") / 1000))) \
+    .persist(StorageLevel.MEMORY_AND_DISK)
+# Fill the cache here, so the read is timed as its own stage
+timer.set_rows(reviews_df.count())
+
+# ALL CHART AGGREGATES
+# Every chart below is derived from two grouping sets computed in a single job
+# (one shuffle) over the joined data: year x rating x sentiment and year x rating x title.
+# grouping_id() has one bit per GROUP BY column (year, rating, sentiment, title)
+# that is set when the column is rolled up.
+timer.begin("chart_aggregates")
+print("Computing chart aggregates...")
+df.createOrReplaceTempView("review_counts")
+aggregates_pd = spark.sql("""
+    SELECT year, rating, sentiment, title,
+           CASE grouping_id() WHEN 1 THEN 'year_rating_sentiment' ELSE 'year_rating_title' END AS grouping_set,
+           SUM(`count`) AS total
+    FROM review_counts
+    GROUP BY year, rating, sentiment, title
+    GROUPING SETS ((year, rating, sentiment), (year, rating, title))
+""").toPandas()
+
+# Save the aggregates so the dashboard (dash_app.py --aggregates) can reuse them
+aggregates_path = os.path.join(output_dir, "aggregates.parquet")
+aggregates_pd.to_parquet(aggregates_path, index=False)
+print(f"Aggregates saved to {aggregates_path}")
+
+timer.set_rows(len(aggregates_pd))
+
+sentiment_set = aggregates_pd[aggregates_pd["grouping_set"] == "year_rating_sentiment"]
+title_set = aggregates_pd[aggregates_pd["grouping_set"] == "year_rating_title"]
+
+# Review count per product (rows without a title are dropped)
+product_counts = title_set.groupby("title")["total"].sum().reset_index()
 
 # Find top products
-top_products = df.groupBy("title").agg(F.sum("count").alias("total_count")).orderBy(F.desc("total_count")).limit(5)
+top_products = product_counts.nlargest(5, "total").rename(columns={"total": "total_count"}).reset_index(drop=True)
 print("Top 5 products:")
-top_products.show(truncate=False)
+print(top_products.to_string())
 
-# Function to save figures to file
-def save_figure(plt, filename, dpi=300):
-    filepath = os.path.join(output_dir, filename)
-    plt.savefig(filepath, dpi=dpi, bbox_inches='tight')
-    print(f"Figure saved to {filepath}")
-    plt.close()
+# CHARTS FROM THE AGGREGATES
+# These need no more Spark jobs, so they render in the pool while the word clouds
+# and brand mentions below are computed
+timer.begin("charts")
+print("Generating rating distribution pie chart...")
+rating_counts = sentiment_set.groupby("rating")["total"].sum().sort_index()
+submit_render(
+    chart_render.render_pie, "rating_distribution.png",
+    rating_counts.index.tolist(), rating_counts.tolist(), "Rating Distribution"
+)
+
+# SENTIMENT PIE CHART
+print("Generating sentiment distribution pie chart...")
+sentiment_counts = sentiment_set.groupby("sentiment")["total"].sum().sort_index()
+submit_render(
+    chart_render.render_pie, "sentiment_distribution.png",
+    sentiment_counts.index.tolist(), sentiment_counts.tolist(), "Sentiment Distribution", "Sentiment"
+)
+
+# BAR CHART
+print("Generating product review count bar charts...")
+# Filter products by minimum review count
+filtered_counts = product_counts[product_counts["total"] >= 1000]
+
+# Get top and bottom 10 products
+top_10_pd = filtered_counts.nlargest(10, "total").reset_index(drop=True)
+bottom_10_pd = filtered_counts.nsmallest(10, "total").reset_index(drop=True)
+submit_render(
+    chart_render.render_product_bars, "product_review_counts.png",
+    top_10_pd["title"].tolist(), top_10_pd["total"].tolist(),
+    bottom_10_pd["title"].tolist(), bottom_10_pd["total"].tolist()
+)
+
+# YEARLY SALES
+print("Generating yearly sales trend chart...")
+yearly_sales = sentiment_set.groupby("year")["total"].sum().sort_index()
+submit_render(
+    chart_render.render_yearly_trend, "yearly_sales_trend.png",
+    yearly_sales.index.tolist(), yearly_sales.tolist()
+)
+
+# RATING TRENDS
+print("Generating rating trends over time chart...")
+# Group by year and rating, then sum the counts
+rating_trends_pd = sentiment_set.groupby(["year", "rating"])["total"].sum().reset_index()
+
+# Pivot the data for plotting
+pivot_data = rating_trends_pd.pivot(index="year", columns="rating", values="total")
+submit_render(
+    chart_render.render_rating_trends, "rating_trends.png", pivot_data.index.tolist(),
+    {rating: pivot_data[rating].tolist() for rating in pivot_data.columns}
+)
 
 # WORD CLOUD PREPARATION 
+# The collect-based functions always sample; they keep their old 10% unless a mode is given
+collect_sample = sample if sample.active else SampleConfig("fraction", 0.1, seed=sample.seed)
+
+# Low-rated reviews per rating, needed to sample by rating and to scale the estimates
+def rating_populations(low_rating_reviews):
+    return {row["rating"]: row["count"] for row in low_rating_reviews.groupBy("rating").count().collect()}
+
 # Function to process review text for wordcloud
-def get_review_text_spark(spark, filepath):
-    # Read the JSONL file
-    reviews_df = spark.read.json(filepath)
-    
+def get_review_text_spark(reviews_df):
     # Filter for low ratings (less than 3)
     low_rating_reviews = reviews_df.filter(reviews_df.rating < 3)
     
@@ -103,8 +315,8 @@ def get_review_text_spark(spark, filepath):
     )
     
     # Sample data for wordcloud if dataset is large
-    # Adjust the fraction based on your dataset size
-    sample_df = low_rating_reviews.sample(False, 0.1)
+    # (choose the size with --sample-mode/--sample-fraction/--sample-size)
+    sample_df = collect_sample.spark_sample(low_rating_reviews, "rating", rating_populations(low_rating_reviews))
     
     # Collect texts locally for wordcloud
     texts = [row.clean_text for row in sample_df.select("clean_text").collect()]
@@ -112,10 +324,7 @@ def get_review_text_spark(spark, filepath):
     return all_text
 
 # Same function for title text
-def get_title_text_spark(spark, filepath):
-    # Read the JSONL file
-    reviews_df = spark.read.json(filepath)
-    
+def get_title_text_spark(reviews_df):
     # Filter for low ratings (less than 3)
     low_rating_reviews = reviews_df.filter(reviews_df.rating < 3)
     
@@ -132,272 +341,120 @@ def get_title_text_spark(spark, filepath):
     )
     
     # Sample data for wordcloud if dataset is large
-    sample_df = low_rating_reviews.sample(False, 0.1)
+    sample_df = collect_sample.spark_sample(low_rating_reviews, "rating", rating_populations(low_rating_reviews))
     
     # Collect titles locally for wordcloud
     texts = [row.clean_title for row in sample_df.select("clean_title").collect()]
     all_text = " ".join(texts)
     return all_text
 
-# Function to create and save wordcloud
-def create_and_save_wordcloud(all_text, title, filename):
-    # Generate the word cloud
-    stopwords = set(STOPWORDS)
-
-    # Generate the word cloud
-    wordcloud = WordCloud(
-        width=1000,
-        height=600,
-        background_color="white",
-        stopwords=stopwords
-    ).generate(all_text)
-
-    # Create figure for the word cloud
-    plt.figure(figsize=(12, 6))
-    plt.imshow(wordcloud, interpolation="bilinear")
-    plt.axis("off")
-    plt.title(title)
+# Count words on the executors and bring only the top N back to the driver.
+# Tokens get the same treatment WordCloud.generate gives them locally
+# (possessive 's dropped, numbers, stopwords and one-letter words removed).
+# With --sample-mode the totals are estimated from the sampled reviews and
+# printed with their margins of error.
+def get_word_frequencies_spark(reviews_df, column, top_n=WORDCLOUD_MAX_WORDS):
+    # Filter for low ratings (less than 3)
+    low_rating_reviews = reviews_df.filter(F.col("rating") < 3)
+    if sample.active:
+        populations = rating_populations(low_rating_reviews)
+        low_rating_reviews = sample.spark_sample(low_rating_reviews, "rating", populations) \
+            .withColumn("review_id", F.monotonically_increasing_id()) \
+            .persist(StorageLevel.MEMORY_AND_DISK)
+    
+    # Clean the text exactly like the collect-based functions above, then split it into words
+    clean_text = F.regexp_replace(
+        F.regexp_replace(F.lower(F.col(column)), r"<.*?>", " "),
+        r"[^a-zA-Z0-9\s']", " "
+    )
+    keep = ["rating", "review_id"] if sample.active else []
+    words = low_rating_reviews.select(*keep, F.explode(F.split(clean_text, r"\s+")).alias("word"))
+    words = words.withColumn(
+        "word", F.regexp_replace(F.regexp_replace(F.col("word"), r"'s$", ""), r"^'+|'+$", "")
+    )
     
-    # Save the figure
-    save_figure(plt, filename)
-    print(f"Wordcloud '{title}' saved as {filename}")
+    stopwords = sorted({word.lower() for word in STOPWORDS})
+    words = words.filter(
+        (F.length("word") > 1)
+        & ~F.col("word").rlike(r"^[0-9]+$")
+        & ~F.col("word").isin(stopwords)
+    )
+    
+    if not sample.active:
+        top_words = words.groupBy("word").count().orderBy(F.desc("count")).limit(top_n).collect()
+        return {row["word"]: row["count"] for row in top_words}
+    
+    estimates = spark_word_estimates(words, low_rating_reviews, "rating", populations, top_n)
+    low_rating_reviews.unpersist()
+    report_top_words(column.capitalize(), sample, [(word, *estimate) for word, estimate in estimates.items()])
+    return {word: estimate for word, (estimate, _) in estimates.items()}
+
+# Render a word cloud from raw text or from word frequencies in the pool
+def create_and_save_wordcloud(words, title, filename):
+    submit_render(chart_render.render_wordcloud, filename, words, title, WORDCLOUD_MAX_WORDS)
+    print(f"Wordcloud '{title}' queued as {filename}")
 
 # Get review text and create wordcloud
+timer.begin("wordclouds")
 print("Generating review text wordcloud...")
-review_text = get_review_text_spark(spark, data_filename)
-create_and_save_wordcloud(review_text, "Review Text", "review_wordcloud.png")
+if args.wordcloud_mode == "distributed":
+    review_words = get_word_frequencies_spark(reviews_df, "text")
+else:
+    review_words = get_review_text_spark(reviews_df)
+create_and_save_wordcloud(review_words, "Review Text", "review_wordcloud.png")
 
 # Get title text and create wordcloud
 print("Generating title text wordcloud...")
-title_text = get_title_text_spark(spark, data_filename)
-create_and_save_wordcloud(title_text, "Title Text", "title_wordcloud.png")
-
-# RATING PIE CHART
-print("Generating rating distribution pie chart...")
-rating_counts = df.groupBy("rating").agg(F.sum("count").alias("total")).orderBy("rating")
-rating_data = rating_counts.collect()
-
-# Convert to lists for plotting
-ratings = [row.rating for row in rating_data]
-counts = [row.total for row in rating_data]
-
-# Plot pie chart
-plt.figure(figsize=(8, 8))
-plt.pie(counts, labels=ratings, autopct="%1.1f%%", startangle=140)
-plt.title("Rating Distribution")
-plt.axis("equal")
-
-# Save the figure
-save_figure(plt, "rating_distribution.png")
-
-# SENTIMENT PIE CHART
-print("Generating sentiment distribution pie chart...")
-sentiment_counts = df.groupBy("sentiment").agg(F.sum("count").alias("total")).orderBy("sentiment")
-sentiment_data = sentiment_counts.collect()
-
-# Convert to lists for plotting
-sentiments = [row.sentiment for row in sentiment_data]
-counts = [row.total for row in sentiment_data]
-
-# Plot pie chart
-plt.figure(figsize=(8, 8))
-wedges, texts, autotexts = plt.pie(
-    counts,
-    labels=sentiments,
-    autopct="%1.1f%%",
-    startangle=140
-)
-
-plt.title("Sentiment Distribution")
-plt.axis("equal")
-
-# Add legend
-plt.legend(wedges, sentiments, title="Sentiment", loc="lower right")
-
-# Save the figure
-save_figure(plt, "sentiment_distribution.png")
-
-# BAR CHART
-print("Generating product review count bar charts...")
-# Group by title and filter by minimum review count
-product_counts = df.groupBy("title").agg(F.sum("count").alias("total"))
-filtered_counts = product_counts.filter(F.col("total") >= 1000)
-
-# Get top and bottom 10 products
-top_10 = filtered_counts.orderBy(F.desc("total")).limit(10)
-bottom_10 = filtered_counts.orderBy("total").limit(10)
-
-# Convert to pandas for easier plotting (this is a small dataset at this point)
-top_10_pd = top_10.toPandas()
-bottom_10_pd = bottom_10.toPandas()
-
-# Create subplot with 2 rows and 1 column
-fig, axes = plt.subplots(2, 1, figsize=(12, 12))
-
-# Top 10 - Horizontal Bar Chart
-axes[0].barh(top_10_pd["title"].iloc[::-1], top_10_pd["total"].iloc[::-1])  # Reverse for highest at top
-axes[0].set_title("Top 10 Products by Review Count")
-axes[0].set_xlabel("Review Count")
-axes[0].set_ylabel("Product Title")
-
-# Bottom 10 - Horizontal Bar Chart
-axes[1].barh(bottom_10_pd["title"], bottom_10_pd["total"], color="orange")
-axes[1].set_title("Bottom 10 Products by Review Count")
-axes[1].set_xlabel("Review Count")
-axes[1].set_ylabel("Product Title")
-
-# Layout and save
-plt.tight_layout()
-save_figure(plt, "product_review_counts.png")
-
-# YEARLY SALES
-print("Generating yearly sales trend chart...")
-yearly_sales = df.groupBy("year").agg(F.sum("count").alias("total")).orderBy("year")
-yearly_data = yearly_sales.collect()
-
-# Convert to lists for plotting
-years = [row.year for row in yearly_data]
-sales = [row.total for row in yearly_data]
-
-# Plotting
-plt.figure(figsize=(12, 6))
-plt.plot(years, sales, marker='o', linestyle='-', linewidth=2)
-
-# Labels and Title
-plt.title("Change in Review Counts (as Sales Proxy) from 2010 to 2023")
-plt.xlabel("Year")
-plt.ylabel("Total Review Count")
-plt.grid(True)
-
-# Save the plot
-save_figure(plt, "yearly_sales_trend.png")
-
-# RATING TRENDS
-print("Generating rating trends over time chart...")
-# Group by year and rating, then sum the counts
-rating_trends = df.groupBy("year", "rating").agg(F.sum("count").alias("total")).orderBy("year", "rating")
-
-# Convert to pandas for easier plotting
-rating_trends_pd = rating_trends.toPandas()
-
-# Pivot the data for plotting
-pivot_data = rating_trends_pd.pivot(index="year", columns="rating", values="total")
-
-# Plotting
-plt.figure(figsize=(12, 6))
-for rating in pivot_data.columns:
-    plt.plot(pivot_data.index, pivot_data[rating], marker='o', label=rating)
-
-# Labels and Title
-plt.title("Rating Trends Over Time")
-plt.xlabel("Year")
-plt.ylabel("Review Count")
-plt.legend(title="Rating")
-plt.grid(True)
-plt.tight_layout()
-
-# Save the plot
-save_figure(plt, "rating_trends.png")
+if args.wordcloud_mode == "distributed":
+    title_words = get_word_frequencies_spark(reviews_df, "title")
+else:
+    title_words = get_title_text_spark(reviews_df)
+create_and_save_wordcloud(title_words, "Title Text", "title_wordcloud.png")
 
 # XBOX/SONY/PLAYSTATION
+timer.begin("brand_mentions")
 print("Generating brand mentions over time chart...")
-# Define a schema for the reviews
-review_schema = StructType([
-    StructField("rating", IntegerType(), True),
-    StructField("title", StringType(), True),
-    StructField("text", StringType(), True),
-    StructField("sentiment", StringType(), True),
-    StructField("asin", StringType(), True),
-    StructField("timestamp", LongType(), True)
-])
-
-# Read the full reviews data
-reviews_df = spark.read.json(data_filename)
-
-# Process the data
-reviews_df = reviews_df.withColumn(
-    "year", F.year(F.from_unixtime(F.col("timestamp") / 1000))
-).withColumn(
-    "month", F.month(F.from_unixtime(F.col("timestamp") / 1000))
-)
-
-# Add platform mention flags
-reviews_df = reviews_df.withColumn(
+# Add the brand mention bitmask: the text is tokenized once and every brand
+# in the keyword registry is looked up in the same pass
+registry = load_keyword_registry()
+brand_df = reviews_df.withColumn(
     "combined_text", F.concat_ws(" ", F.lower(F.col("title")), F.lower(F.col("text")))
 ).withColumn(
-    "mentions_xbox", F.array_contains(F.split(F.col("combined_text"), " "), "microsoft")
-).withColumn(
-    "mentions_nintendo", F.array_contains(F.split(F.col("combined_text"), " "), "nintendo")
-).withColumn(
-    "mentions_sony", F.array_contains(F.split(F.col("combined_text"), " "), "sony")
-).withColumn(
-    "mentions_controller", F.array_contains(F.split(F.col("combined_text"), " "), "controller")
+    "mentions", registry.spark_mask(F.col("combined_text"))
 )
 
-# Create a date column
-reviews_df = reviews_df.withColumn(
-    "date", F.to_date(F.concat_ws("-", F.col("year"), F.col("month"), F.lit("01")))
-)
-
-# Group by year-month for each platform
-xbox_counts = reviews_df.filter(F.col("mentions_xbox") == True) \
-    .groupBy(F.year("date"), F.month("date")) \
-    .count() \
-    .withColumnRenamed("count", "xbox_count") \
-    .withColumn("year_month", F.concat_ws("-", F.col("year(date)"), F.col("month(date)")))
-
-nintendo_counts = reviews_df.filter(F.col("mentions_nintendo") == True) \
-    .groupBy(F.year("date"), F.month("date")) \
-    .count() \
-    .withColumnRenamed("count", "nintendo_count") \
-    .withColumn("year_month", F.concat_ws("-", F.col("year(date)"), F.col("month(date)")))
-
-sony_counts = reviews_df.filter(F.col("mentions_sony") == True) \
-    .groupBy(F.year("date"), F.month("date")) \
-    .count() \
-    .withColumnRenamed("count", "sony_count") \
-    .withColumn("year_month", F.concat_ws("-", F.col("year(date)"), F.col("month(date)")))
-
-# Join all platforms data
-all_platforms = xbox_counts.join(
-    nintendo_counts, 
-    ["year(date)", "month(date)", "year_month"], 
-    "outer"
-).join(
-    sony_counts, 
-    ["year(date)", "month(date)", "year_month"], 
-    "outer"
-)
-
-# Fill null values with 0
-all_platforms = all_platforms.fillna(0)
+# Count mentions per year-month for every platform in one aggregation
+platforms = ["xbox", "nintendo", "sony"]
+all_platforms = brand_df.filter(F.col("year").isNotNull()) \
+    .groupBy("year", "month") \
+    .agg(*[F.sum(registry.spark_flag(F.col("mentions"), brand)).alias(f"{brand}_count") for brand in platforms]) \
+    .withColumn("year_month", F.concat_ws("-", F.col("year"), F.col("month")))
 
 # Convert to pandas for plotting
-platforms_pd = all_platforms.select("year_month", "xbox_count", "nintendo_count", "sony_count").orderBy("year_month").toPandas()
-
-# Plot the data
-plt.figure(figsize=(14, 7))
-plt.plot(platforms_pd["year_month"], platforms_pd["xbox_count"], label="Xbox", color="green")
-plt.plot(platforms_pd["year_month"], platforms_pd["nintendo_count"], label="Nintendo", color="red")
-plt.plot(platforms_pd["year_month"], platforms_pd["sony_count"], label="Sony", color="blue")
-
-plt.title("Brand Mentions by Month")
-plt.xlabel("Month")
-plt.ylabel("Number of Mentions")
-plt.grid(True)
-plt.legend()
-
-# Make x-axis labels more readable
-plt.xticks(
-    ticks=range(0, len(platforms_pd), 6),  # Every 6 months
-    labels=platforms_pd["year_month"].iloc[::6],
-    rotation=45
+platforms_pd = all_platforms.orderBy("year", "month").select("year_month", "xbox_count", "nintendo_count", "sony_count").toPandas()
+
+submit_render(
+    chart_render.render_brand_mentions, "brand_mentions.png",
+    platforms_pd["year_month"].tolist(),
+    {
+        "Xbox": ("green", platforms_pd["xbox_count"].tolist()),
+        "Nintendo": ("red", platforms_pd["nintendo_count"].tolist()),
+        "Sony": ("blue", platforms_pd["sony_count"].tolist())
+    }
 )
 
-plt.tight_layout()
+timer.set_rows(len(platforms_pd))
+
+# Wait for the figures still rendering in the pool
+timer.begin("render")
+timer.set_rows(len(chart_render.wait_for_renders(renders)))
+render_pool.shutdown()
 
-# Save the plot
-save_figure(plt, "brand_mentions.png")
+# Stage timings (collected before the HTML report so it can include them)
+stage_report = timer.finish()
+stage_report_path = os.path.join(output_dir, "stage_report.json")
+save_stage_report(stage_report, stage_report_path)
+print(f"Stage report saved to {stage_report_path}")
 
 # Generate an HTML report of all visualizations
 html_output = f"""<!DOCTYPE html>
@@ -410,6 +467,8 @@ html_output = f"""<!DOCTYPE html>
         h2 {{ color: #666699; margin-top: 30px; }}
         img {{ max-width: 800px; border: 1px solid #ddd; margin: 10px 0; }}
         .section {{ margin-bottom: 40px; }}
+        table {{ border-collapse: collapse; }}
+        td, th {{ border: 1px solid #ddd; padding: 4px 8px; text-align: right; }}
     </style>
 </head>
 <body>
@@ -418,7 +477,7 @@ html_output = f"""<!DOCTYPE html>
     <div class="section">
         <h2>Top Products</h2>
         <p>Top 5 products by review count:</p>
-        <pre>{top_products.toPandas().to_html()}</pre>
+        <pre>{top_products.to_html()}</pre>
     </div>
     
     <div class="section">
@@ -459,6 +518,12 @@ html_output = f"""<!DOCTYPE html>
         <p>Brand mentions over time:</p>
         <img src="brand_mentions.png" alt="Brand Mentions">
     </div>
+    
+    <div class="section">
+        <h2>Pipeline Stages</h2>
+        <p>Wall time and Spark metrics of each stage of this run:</p>
+        {stage_report_html(stage_report)}
+    </div>
 </body>
 </html>
 """
@@ -473,4 +538,5 @@ print(f"All visualizations saved to {output_dir}/")
 print("Analysis complete!")
 
 # Stop the Spark session when done
+reviews_df.unpersist()
 spark.stop()
\ No newline at end of file
@@ -0,0 +1,128 @@
+# Named stages for spark_codes.py with per-stage timing and Spark metrics.
+# Every stage runs its jobs under its own job group, so the status tracker can tell
+# which jobs and Spark stages belong to it; their input rows and shuffle bytes are
+# read from the application's monitoring REST API once the run is finished.
+import html
+import json
+import time
+import urllib.request
+
+# Stage metrics summed over every Spark stage (and attempt) of a named stage
+METRIC_FIELDS = {
+    "inputRecords": "input_rows",
+    "inputBytes": "input_bytes",
+    "shuffleReadBytes": "shuffle_read_bytes",
+    "shuffleWriteBytes": "shuffle_write_bytes",
+    "outputRecords": "output_rows",
+}
+
+class StageTimer:
+    def __init__(self, spark):
+        self.sc = spark.sparkContext
+        self.stages = []
+        self.current = None
+        self.started = time.perf_counter()
+
+    # Start a named stage; the previous one ends here
+    def begin(self, name):
+        self.end()
+        group = f"{len(self.stages):02d}-{name}"
+        self.sc.setJobGroup(group, name)
+        self.current = {"name": name, "group": group, "started": time.perf_counter(), "rows": None}
+        print(f"Stage {name}...")
+
+    # Rows the stage produced or processed, when the script knows them
+    def set_rows(self, rows):
+        self.current["rows"] = int(rows)
+
+    def end(self):
+        if self.current is None:
+            return
+        stage = self.current
+        self.current = None
+
+        tracker = self.sc.statusTracker()
+        job_ids = sorted(tracker.getJobIdsForGroup(stage["group"]))
+        stage_ids = set()
+        for job_id in job_ids:
+            info = tracker.getJobInfo(job_id)
+            if info is not None:
+                stage_ids.update(info.stageIds)
+
+        self.stages.append({
+            "name": stage["name"],
+            "seconds": time.perf_counter() - stage["started"],
+            "rows": stage["rows"],
+            "job_ids": job_ids,
+            "stage_ids": sorted(stage_ids),
+        })
+        self.sc.setLocalProperty("spark.jobGroup.id", None)
+
+    # Summed metrics of the given Spark stages, or None when the UI is disabled
+    def stage_metrics(self, stage_ids):
+        url = self.sc.uiWebUrl
+        if not url:
+            return None
+        totals = dict.fromkeys(METRIC_FIELDS.values(), 0)
+        for stage_id in stage_ids:
+            try:
+                with urllib.request.urlopen(
+                    f"{url}/api/v1/applications/{self.sc.applicationId}/stages/{stage_id}", timeout=10
+                ) as response:
+                    attempts = json.load(response)
+            except (OSError, ValueError):
+                return None
+            for attempt in attempts:
+                for field, name in METRIC_FIELDS.items():
+                    totals[name] += attempt.get(field, 0)
+        return totals
+
+    # End the last stage and build the report (must run before spark.stop())
+    def finish(self):
+        self.end()
+        for stage in self.stages:
+            stage["metrics"] = self.stage_metrics(stage["stage_ids"])
+        return {
+            "application_id": self.sc.applicationId,
+            "master": self.sc.master,
+            "total_seconds": time.perf_counter() - self.started,
+            "stages": self.stages,
+        }
+
+def save_stage_report(report, path):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+def format_bytes(count):
+    if count is None:
+        return ""
+    for unit in ["B", "KB", "MB", "GB"]:
+        if count < 1024 or unit == "GB":
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1024
+
+# HTML table of the stage report for analysis_report.html
+def stage_report_html(report):
+    rows = []
+    for stage in report["stages"]:
+        metrics = stage["metrics"] or {}
+        rows.append(
+            "<tr>"
+            f"<td>{html.escape(stage['name'])}</td>"
+            f"<td>{stage['seconds']:.1f}</td>"
+            f"<td>{', '.join(map(str, stage['job_ids']))}</td>"
+            f"<td>{', '.join(map(str, stage['stage_ids']))}</td>"
+            f"<td>{'' if stage['rows'] is None else stage['rows']}</td>"
+            f"<td>{metrics.get('input_rows', '')}</td>"
+            f"<td>{format_bytes(metrics.get('shuffle_read_bytes'))}</td>"
+            f"<td>{format_bytes(metrics.get('shuffle_write_bytes'))}</td>"
+            "</tr>"
+        )
+    return (
+        "<table>\n"
+        "<tr><th>Stage</th><th>Seconds</th><th>Jobs</th><th>Spark stages</th><th>Rows</th>"
+        "<th>Input rows</th><th>Shuffle read</th><th>Shuffle write</th></tr>\n"
+        + "\n".join(rows)
+        + f"\n</table>\n<p>Total: {report['total_seconds']:.1f}s ({html.escape(report['master'])}, "
+          f"{html.escape(report['application_id'])})</p>"
+    )
@@ -0,0 +1,183 @@
+# On-disk, memory-mapped token ids of the review titles and texts.
+# Every review is stored as ids into one vocabulary shared by both text fields, in
+# one file per (field, rating), so the reviews of a rating range are a few contiguous
+# reads and the raw text never has to stay in the dashboard's memory.
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pyarrow as pa
+
+from word_index import RATINGS, TEXT_FIELDS
+
+TOKEN_DTYPE = np.uint32
+LENGTH_DTYPE = np.uint32
+
+# Tokens counted per step, so a count never converts a whole file at once
+COUNT_BLOCK = 1 << 24
+
+# Bytes copied per step by link_prefix
+COPY_BLOCK = 1 << 24
+
+VOCAB_FILE = "vocab.arrow"
+
+# Tokens and reviews of each (field, rating) file that belong to the store
+SIZES_FILE = "sizes.json"
+
+def tokens_path(directory, field, rating):
+    return os.path.join(directory, f"{field}.{rating}.tokens")
+
+# Number of tokens of each review, in the same order as the tokens file
+def lengths_path(directory, field, rating):
+    return os.path.join(directory, f"{field}.{rating}.lengths")
+
+def sizes_key(field, rating):
+    return f"{field}.{rating}"
+
+# The first `count` values of a file (np.memmap refuses empty files)
+def map_array(path, dtype, count):
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+# Put the first `nbytes` of `source` at `path`: a hard link while the source holds
+# exactly those bytes, otherwise a copy of them. Anything after them was appended by
+# another extension of the same files (a failed one, or one from an older base), and
+# cutting the shared file back would cut off the reviews of a store that maps them.
+def link_prefix(source, path, nbytes):
+    if os.path.getsize(source) == nbytes:
+        os.link(source, path)
+        return
+    with open(source, "rb") as src, open(path, "wb") as dst:
+        while nbytes > 0:
+            block = src.read(min(nbytes, COPY_BLOCK))
+            if not block:
+                break
+            dst.write(block)
+            nbytes -= len(block)
+
+# Streams token ids to disk batch by batch while the reviews are parsed.
+# Files are written to a temporary directory that replaces `directory` on close.
+# With a `base` store the files are hard links to its files and the new reviews are
+# appended to them, so only those are written (the vocabulary must extend the base's).
+# Each store only reads the part of the files its sizes file records, so the base
+# keeps seeing exactly its own reviews. A writer that is not closed must be aborted.
+class TokenStoreWriter:
+    def __init__(self, directory, base=None):
+        self.directory = directory
+        # A fresh sibling per writer, so two processes writing the same version never share it
+        parent = os.path.dirname(directory) or "."
+        os.makedirs(parent, exist_ok=True)
+        self.tmp_dir = tempfile.mkdtemp(prefix=os.path.basename(directory) + ".", suffix=".tmp", dir=parent)
+        self.files = {}
+        self.sizes = {}
+        try:
+            for field in TEXT_FIELDS:
+                for rating in RATINGS:
+                    paths = (tokens_path(self.tmp_dir, field, rating), lengths_path(self.tmp_dir, field, rating))
+                    sizes = [0, 0]
+                    if base is not None:
+                        sizes = [base.token_count(field, rating), base.review_count(field, rating)]
+                        link_prefix(tokens_path(base.directory, field, rating), paths[0],
+                                    sizes[0] * np.dtype(TOKEN_DTYPE).itemsize)
+                        link_prefix(lengths_path(base.directory, field, rating), paths[1],
+                                    sizes[1] * np.dtype(LENGTH_DTYPE).itemsize)
+                    self.files[field, rating] = tuple(open(path, "ab") for path in paths)
+                    self.sizes[sizes_key(field, rating)] = sizes
+        except BaseException:
+            self.abort()
+            raise
+
+    # Append one batch: `rows` holds each review's rating row (-1 when the rating is
+    # missing, those reviews are left out), `tokens` the concatenated ids of all reviews
+    def append(self, field, rows, tokens, lengths):
+        token_rows = np.repeat(rows, lengths)
+        for row, rating in enumerate(RATINGS):
+            selected = rows == row
+            if not selected.any():
+                continue
+            tokens_file, lengths_file = self.files[field, rating]
+            selected_tokens = tokens[token_rows == row]
+            selected_tokens.astype(TOKEN_DTYPE).tofile(tokens_file)
+            lengths[selected].astype(LENGTH_DTYPE).tofile(lengths_file)
+            sizes = self.sizes[sizes_key(field, rating)]
+            sizes[0] += len(selected_tokens)
+            sizes[1] += int(selected.sum())
+
+    def close(self, vocab):
+        for tokens_file, lengths_file in self.files.values():
+            tokens_file.close()
+            lengths_file.close()
+
+        table = pa.table({"word": pa.array(vocab, type=pa.large_string())})
+        with pa.OSFile(os.path.join(self.tmp_dir, VOCAB_FILE), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        with open(os.path.join(self.tmp_dir, SIZES_FILE), "w") as f:
+            json.dump(self.sizes, f)
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.replace(self.tmp_dir, self.directory)
+        return TokenStore(self.directory)
+
+    # Drop the temporary directory of a load that failed
+    def abort(self):
+        for files in self.files.values():
+            for f in files:
+                f.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+# Read side: every file is memory-mapped, so only the pages a query touches are loaded
+class TokenStore:
+    def __init__(self, directory):
+        self.directory = directory
+        self.vocab = pa.ipc.open_file(pa.memory_map(os.path.join(directory, VOCAB_FILE), "r")).read_all().column("word")
+        with open(os.path.join(directory, SIZES_FILE), "r") as f:
+            self.sizes = json.load(f)
+
+    def tokens(self, field, rating):
+        return map_array(tokens_path(self.directory, field, rating), TOKEN_DTYPE, self.token_count(field, rating))
+
+    def lengths(self, field, rating):
+        return map_array(lengths_path(self.directory, field, rating), LENGTH_DTYPE, self.review_count(field, rating))
+
+    # Start offset of each review's tokens, plus the total at the end
+    def offsets(self, field, rating):
+        offsets = np.zeros(len(self.lengths(field, rating)) + 1, dtype=np.int64)
+        np.cumsum(self.lengths(field, rating), out=offsets[1:])
+        return offsets
+
+    # Occurrences of every vocabulary word in the reviews with the given rating,
+    # counted from token position `first` on
+    def counts(self, field, rating, first=0):
+        tokens = self.tokens(field, rating)
+        counts = np.zeros(len(self.vocab), dtype=np.int64)
+        for start in range(first, len(tokens), COUNT_BLOCK):
+            counts += np.bincount(tokens[start:start + COUNT_BLOCK], minlength=len(self.vocab))
+        return counts
+
+    def token_count(self, field, rating):
+        return self.sizes[sizes_key(field, rating)][0]
+
+    def review_count(self, field, rating):
+        return self.sizes[sizes_key(field, rating)][1]
+
+    # Per-word sums and sums of squares of the per-review counts over the given
+    # (sorted) reviews of one rating; only their tokens are read from disk
+    def sample_counts(self, field, rating, reviews):
+        offsets = self.offsets(field, rating)
+        starts = offsets[reviews]
+        lengths = offsets[reviews + 1] - starts
+        before = np.cumsum(lengths) - lengths
+        positions = np.repeat(starts - before, lengths) + np.arange(lengths.sum())
+        tokens = self.tokens(field, rating)[positions].astype(np.int64)
+
+        vocab_size = len(self.vocab)
+        review_of = np.repeat(np.arange(len(reviews), dtype=np.int64), lengths)
+        cells, cell_counts = np.unique(review_of * vocab_size + tokens, return_counts=True)
+        words = cells % vocab_size
+        sums = np.bincount(words, weights=cell_counts, minlength=vocab_size)
+        sumsq = np.bincount(words, weights=cell_counts.astype(np.float64) ** 2, minlength=vocab_size)
+        return sums, sumsq
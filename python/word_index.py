@@ -0,0 +1,127 @@
+# Per-rating word-frequency tables for the word-cloud callbacks, built once at load time
+import html
+import re
+
+import numpy as np
+from wordcloud import STOPWORDS
+
+from sampling import stratum_estimates
+
+TAG_PATTERN = re.compile(r"<.*?>")
+NON_WORD_PATTERN = re.compile(r"[^a-zA-Z0-9\s']")
+STOPWORDS_LOWER = {word.lower() for word in STOPWORDS}
+
+# Ratings the index is split by (row i of each matrix holds rating i + 1)
+RATINGS = [1, 2, 3, 4, 5]
+TEXT_FIELDS = ["review_text", "title_text"]
+
+# Clean a review the same way the word clouds always have, then apply the
+# filtering WordCloud.generate would do (possessive 's, numbers, stopwords)
+def tokenize(text):
+    clean_text = html.unescape(text)
+    clean_text = TAG_PATTERN.sub(" ", clean_text)
+    clean_text = NON_WORD_PATTERN.sub(" ", clean_text).lower()
+
+    tokens = []
+    for word in clean_text.split():
+        if word.endswith("'s"):
+            word = word[:-2]
+        word = word.strip("'")
+        if len(word) < 2 and word not in ("i", "a"):
+            continue
+        if word.isdigit() or word in STOPWORDS_LOWER:
+            continue
+        tokens.append(word)
+    return tokens
+
+# Map a review rating onto the index rows; None when it is outside 1-5
+def rating_row(rating):
+    if rating != rating or not 1 <= rating <= 5:
+        return None
+    return int(rating) - 1
+
+# Same for an array of ratings, with -1 for the ones outside 1-5
+def rating_rows(ratings):
+    ratings = np.asarray(ratings)
+    valid = (ratings >= 1) & (ratings <= 5)
+    rows = np.full(len(ratings), -1, dtype=np.int8)
+    rows[valid] = ratings[valid].astype(np.int64) - 1
+    return rows
+
+# Token frequencies for ratings 1-5, stored as a shared vocabulary plus a
+# ratings x vocabulary count matrix per text field. Built from a sample the matrices
+# hold estimated totals, with a matching matrix of estimation variances.
+class WordFrequencyIndex:
+    def __init__(self):
+        self.vocab = {}
+        self.matrix = {}
+        self.variance = {}
+
+    # Count every token of the on-disk token store (see text_store.py) once,
+    # or only the reviews picked by an active SampleConfig
+    @classmethod
+    def from_token_store(cls, store, sample=None):
+        index = cls()
+        if sample is not None and sample.active:
+            return index.estimate_from_sample(store, sample)
+        for field in TEXT_FIELDS:
+            index.vocab[field] = store.vocab
+            index.matrix[field] = np.vstack([store.counts(field, rating) for rating in RATINGS])
+        return index
+
+    # Index of a store that extends `base_store` (the store this index was counted
+    # from) with more reviews: only the appended tokens are counted and added on
+    def extended(self, store, base_store):
+        index = WordFrequencyIndex()
+        for field in TEXT_FIELDS:
+            matrix = np.zeros((len(RATINGS), len(store.vocab)), dtype=np.int64)
+            matrix[:, :self.matrix[field].shape[1]] = self.matrix[field]
+            for row, rating in enumerate(RATINGS):
+                matrix[row] += store.counts(field, rating, first=base_store.token_count(field, rating))
+            index.vocab[field] = store.vocab
+            index.matrix[field] = matrix
+        return index
+
+    # Both fields use the same reviews, so titles and texts stay comparable
+    def estimate_from_sample(self, store, sample):
+        populations = [store.review_count("review_text", rating) for rating in RATINGS]
+        reviews = sample.indices(populations)
+        for field in TEXT_FIELDS:
+            estimates = []
+            variances = []
+            for rating, rows, population in zip(RATINGS, reviews, populations):
+                sums, sumsq = store.sample_counts(field, rating, rows)
+                estimate, variance = stratum_estimates(sums, sumsq, len(rows), population)
+                estimates.append(estimate)
+                variances.append(variance)
+            self.vocab[field] = store.vocab
+            self.matrix[field] = np.vstack(estimates)
+            self.variance[field] = np.vstack(variances)
+        return self
+
+    # Summed frequencies over an inclusive rating range and the positions of its top words
+    def top_positions(self, field, min_rating=1, max_rating=5, max_words=None):
+        rows = slice(max(min_rating, 1) - 1, max(min(max_rating, 5), 0))
+        totals = self.matrix[field][rows].sum(axis=0)
+
+        if max_words is not None and len(totals) > max_words:
+            top = np.argpartition(-totals, max_words)[:max_words]
+        else:
+            top = np.arange(len(totals))
+        return rows, totals, top[totals[top] > 0]
+
+    # Summed frequencies of the top words for an inclusive rating range
+    def frequencies(self, field, min_rating=1, max_rating=5, max_words=None):
+        _, totals, top = self.top_positions(field, min_rating, max_rating, max_words)
+        return dict(zip(self.vocab[field].take(top).to_pylist(), totals[top].tolist()))
+
+    # The k most frequent words of a rating range as (word, total, standard error),
+    # most frequent first; the error is 0 for an index counted over all reviews
+    def top_words(self, field, min_rating=1, max_rating=5, k=10):
+        rows, totals, top = self.top_positions(field, min_rating, max_rating, k)
+        top = top[np.argsort(-totals[top], kind="stable")]
+        if field in self.variance:
+            errors = np.sqrt(self.variance[field][rows].sum(axis=0)[top])
+        else:
+            errors = np.zeros(len(top))
+        return list(zip(self.vocab[field].take(top).to_pylist(), totals[top].tolist(), errors.tolist()))